@@ -0,0 +1,124 @@
+# benchmarks/bench_concurrent_fetch.py
+'''
+Замер параллельного опроса источников и дедлайна обновления на локальных заглушках API.
+Запуск из корня проекта: python benchmarks/bench_concurrent_fetch.py [задержка_с] [число_монет]
+Две заглушки (CoinGecko и ExchangeRate-API) на http.server отвечают с заданной задержкой;
+ParserConfig направляется на них, обновление идет через RatesUpdater.run_update.
+Работает во временном каталоге данных, data/ не затрагивается
+'''
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DELAY = float(sys.argv[1]) if len(sys.argv) > 1 else 0.5
+COINS = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+ROUNDS = 3
+
+data_dir = tempfile.mkdtemp(prefix='valutatrade_bench_')
+os.environ['VALUTATRADE_DATA_DIR'] = data_dir
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient  # noqa: E402
+from valutatrade_hub.parser_service.config import ParserConfig  # noqa: E402
+from valutatrade_hub.parser_service.updater import RatesUpdater  # noqa: E402
+
+FIAT = ('EUR', 'GBP', 'RUB', 'JPY', 'CNY')
+
+
+# Заглушка API: ответ после задержки, без кеширования на стороне клиента
+def start_stub(build_body):
+    class Handler(BaseHTTPRequestHandler):
+        delay = DELAY
+
+        def do_GET(self):
+            time.sleep(Handler.delay)
+            url = urlparse(self.path)
+            body = json.dumps(build_body(url.path, parse_qs(url.query))).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, Handler
+
+
+def coingecko_body(path, query):
+    ids = query.get('ids', [''])[0].split(',')
+    return {gecko_id: {'usd': 1.0 + time.time() % 1} for gecko_id in ids if gecko_id}
+
+
+def exchangerate_body(path, query):
+    return {'result': 'success', 'conversion_rates': {code: 1.0 + time.time() % 1 for code in FIAT}}
+
+
+coingecko_server, coingecko_stub = start_stub(coingecko_body)
+exchangerate_server, exchangerate_stub = start_stub(exchangerate_body)
+
+universe_path = os.path.join(data_dir, 'universe.json')
+with open(universe_path, 'w', encoding='utf-8') as f:
+    json.dump({f'C{i:04d}': f'benchmark-coin-{i:04d}' for i in range(COINS)}, f)
+
+config = ParserConfig(
+    EXCHANGERATE_API_KEY='benchmark',
+    COINGECKO_URL=f'http://127.0.0.1:{coingecko_server.server_port}/simple/price',
+    EXCHANGERATE_API_URL=f'http://127.0.0.1:{exchangerate_server.server_port}/v6',
+    CRYPTO_UNIVERSE_FILE=universe_path,
+    FIAT_CURRENCIES=FIAT,
+    RATES_FILE_PATH=os.path.join(data_dir, 'rates.json'),
+    HISTORY_FILE_PATH=os.path.join(data_dir, 'exchange_rates.json'),
+    HTTP_CACHE_FILE_PATH=os.path.join(data_dir, 'http_cache.json'),
+    HISTORY_DIR=os.path.join(data_dir, 'history'),
+    CANDLES_DIR=os.path.join(data_dir, 'candles'),
+    RATE_LIMITS={'coingecko': (60000.0, 1000), 'exchangerate': (60000.0, 1000)},
+    REQUEST_RETRIES=1
+)
+chunks = len(config.get_coingecko_param_chunks())
+updater = RatesUpdater(config)
+
+
+def measure(title: str, fn, rounds: int = ROUNDS):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = fn()
+    elapsed = (time.perf_counter() - started) / rounds
+    print(f'{title:<44} {elapsed:>8.2f} с')
+    return elapsed, result
+
+
+print(f'Монет: {COINS} ({chunks} запросов CoinGecko), задержка заглушек: {DELAY} с, каталог: {data_dir}')
+
+# Последовательный опрос: части CoinGecko одна за другой, затем ExchangeRate-API
+serial_config = replace(config, FETCH_WORKERS=1)
+serial_clients = [CoinGeckoClient(serial_config), ExchangeRateApiClient(serial_config)]
+serial, _ = measure('Последовательно (клиенты по очереди)', lambda: [client.fetch_rates() for client in serial_clients])
+
+concurrent, rates = measure('Параллельно (RatesUpdater.run_update)', updater.run_update)
+print(f'{"Ускорение":<44} {serial / concurrent:>8.1f} x')
+print(f'{"Получено курсов":<44} {len(rates):>8}')
+
+# Медленный источник не задерживает обновление дольше дедлайна
+config.UPDATE_DEADLINE_SECONDS = DELAY * 3
+exchangerate_stub.delay = DELAY * 10
+late, rates = measure(f'Дедлайн {config.UPDATE_DEADLINE_SECONDS:.1f} с, ExchangeRate-API {exchangerate_stub.delay:.1f} с',
+                      updater.run_update, rounds=1)
+fiat_pairs = [pair for pair in rates if pair.split('_')[0] in FIAT]
+print(f'{"Курсов без опоздавшего источника":<44} {len(rates):>8} (фиатных: {len(fiat_pairs)})')
+if late > config.UPDATE_DEADLINE_SECONDS + DELAY:
+    print('Ошибка: Обновление не уложилось в дедлайн')
+
+coingecko_server.shutdown()
+exchangerate_server.shutdown()
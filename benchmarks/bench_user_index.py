@@ -0,0 +1,75 @@
+# benchmarks/bench_user_index.py
+'''
+Замер входа, регистрации и сделок (UserManager, PortfolioManager) при 100 000 пользователей.
+Запуск из корня проекта: python benchmarks/bench_user_index.py [число_пользователей]
+(VALUTATRADE_PORTFOLIO_STORAGE=journal - сделки через журнал вместо перезаписи portfolios.json)
+Работает во временном каталоге данных, data/ не затрагивается
+'''
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+ROUNDS = 200
+
+data_dir = tempfile.mkdtemp(prefix='valutatrade_bench_')
+os.environ['VALUTATRADE_DATA_DIR'] = data_dir
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настоящий хеш пароля, чтобы вход проходил проверку
+SALT = 'benchmarksalt'
+PASSWORD = 'password'
+PASSWORD_HASH = hashlib.sha256((PASSWORD + SALT).encode()).hexdigest()
+
+users = [
+    {
+        'user_id': user_id,
+        'username': f'user{user_id}',
+        'hashed_password': PASSWORD_HASH,
+        'salt': SALT,
+        'registration_date': '2026-01-01T00:00:00'
+    }
+    for user_id in range(1, USERS + 1)
+]
+portfolios = [{'user_id': user_id, 'wallets': {'USD': {'balance': 10000.0}}} for user_id in range(1, USERS + 1)]
+for name, data in (('users', users), ('portfolios', portfolios)):
+    with open(os.path.join(data_dir, f'{name}.json'), 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+with open(os.path.join(data_dir, 'rates.json'), 'w', encoding='utf-8') as f:
+    json.dump({'schema_version': 2, 'timestamp': None, 'source': 'benchmark', 'base_currency': 'USD',
+               'rates': {'BTC_USD': 100000.0}, 'pair_timestamps': {}, 'pair_sources': {}}, f)
+
+from valutatrade_hub.core.currencies import initialize_currencies  # noqa: E402
+from valutatrade_hub.core.usecases import PortfolioManager, UserManager  # noqa: E402
+from valutatrade_hub.infra.database import db  # noqa: E402
+
+initialize_currencies()
+
+
+def measure(title: str, fn, rounds: int = ROUNDS):
+    started = time.perf_counter()
+    for i in range(rounds):
+        fn(i)
+    elapsed = (time.perf_counter() - started) / rounds
+    print(f'{title:<40} {elapsed * 1e6:>12.1f} мкс/оп')
+
+
+print(f'Пользователей: {USERS}, каталог: {data_dir}, портфели: {os.getenv("VALUTATRADE_PORTFOLIO_STORAGE", "json")}')
+
+started = time.perf_counter()
+db.find_one('users', 'username', 'user1')
+db.find_one('portfolios', 'user_id', 1)
+print(f'{"Первая загрузка + построение индексов":<40} {(time.perf_counter() - started) * 1e3:>12.1f} мс')
+
+user_manager = UserManager()
+measure('Вход (UserManager.login)', lambda i: user_manager.login(f'user{USERS - i}', PASSWORD))
+measure('Регистрация (UserManager.register_user)', lambda i: user_manager.register_user(f'newuser{i}', PASSWORD), 20)
+
+portfolio_manager = PortfolioManager()
+measure('Чтение портфеля (индекс)', lambda i: portfolio_manager.get_user_portfolio(USERS - i))
+# В режиме json каждая сделка переписывает весь portfolios.json - O(числа пользователей);
+# journal и sharded пишут запись журнала или один бакет
+measure(f'Покупка ({os.getenv("VALUTATRADE_PORTFOLIO_STORAGE", "json")})', lambda i: portfolio_manager.buy_currency(USERS - i, 'BTC', 0.001), 20)
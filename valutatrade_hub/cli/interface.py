@@ -2,7 +2,7 @@
 import os
 import sys
 
-from ..infra.database import db
+from ..core.rates import rate_snapshots
 
 
 class InteractiveCLI:
@@ -16,7 +16,7 @@ class InteractiveCLI:
         
         self.parser_config = ParserConfig.from_env()
         self.rates_updater = RatesUpdater(self.parser_config)
-        self.scheduler = Scheduler(self.parser_config)
+        self.scheduler = Scheduler(self.parser_config, self.rates_updater)
 
         setup_logging()
         initialize_currencies()
@@ -128,13 +128,21 @@ class InteractiveCLI:
             print(f'Количество пар: {status['total_pairs']}')
             print(f'Источник: {status['source']}')
             
-            rates_data = db.load_data('rates') or {}
-            pairs = list(rates_data.get('pairs', {}).keys())[:5]
+            print('\nСостояние источников:')
+            for source, breaker in self.rates_updater.get_sources_status().items():
+                line = f'   {source}: {breaker['state']}, ошибок подряд: {breaker['failures']}'
+                if breaker['retry_in']:
+                    line += f', повтор через {breaker['retry_in']:.0f} с'
+                print(line)
+                if breaker['last_error']:
+                    print(f'      последняя ошибка: {breaker['last_error']}')
+            
+            snapshot = rate_snapshots.current()
+            pairs = list(snapshot.rates)[:5]
             
             print('\nПримеры текущих курсов:')
             for pair in pairs:
-                rate_info = rates_data['pairs'][pair]
-                print(f'   {pair}: {rate_info['rate']:.6f}')
+                print(f'   {pair}: {snapshot.rates[pair]:.6f}')
             
         except Exception as e:
             print(f'Ошибка: Произошла ошибка: {e}')
@@ -288,36 +296,28 @@ class InteractiveCLI:
         self.print_header('Процедура: Ваш портфель')
         
         try:
-            portfolio = self.portfolio_manager.get_user_portfolio(
-                self.user_manager.current_user.user_id
+            base_currency = 'USD'
+            valuation = self.portfolio_manager.value_portfolio(
+                self.user_manager.current_user.user_id,
+                base_currency
             )
             
-            if not portfolio.wallets:
+            if not valuation['wallets']:
                 print('Ошибка: Ваш портфель пуст.')
                 self.wait_for_enter()
                 return
             
-            base_currency = 'USD'
-            total_value = 0.0
+            total_value = valuation['total']
             
 
             print(f'{"Валюта":<10} {"Баланс":<15} {"Стоимость в USD":<20}')
             print('-' * 50)
             
 
-            for currency_code, wallet in portfolio.wallets.items():
-                if currency_code == base_currency:
-                    value = wallet.balance
-                else:
-                    try:
-                        rate = self.rate_manager.get_rate(currency_code, base_currency)
-                        value = wallet.balance * rate
-                    except Exception:
-                        value = 0.0
-                
-                total_value += value
+            for currency_code, wallet_info in valuation['wallets'].items():
+                value = wallet_info['value']
                 
-                balance_str = f'{wallet.balance:.2f}'
+                balance_str = f'{wallet_info['balance']:.2f}'
                 value_str = f'{value:,.2f}' if value >= 1000 else f'{value:.2f}'
                 
                 print(f'{currency_code:<10} {balance_str:<15} {value_str:<20} {base_currency}')
@@ -560,9 +560,9 @@ class InteractiveCLI:
         '''
         
         try:
-            rates_data = db.load_data('rates') or {'rates': {}, 'timestamp': None}
-            rates = rates_data.get('rates', {})
-            timestamp = rates_data.get('timestamp')
+            snapshot = rate_snapshots.current()
+            rates = snapshot.rates
+            timestamp = snapshot.timestamp
             
             if not rates:
                 print('Ошибка: Нет данных о курсах. Выполните обновление данных.')
@@ -0,0 +1,298 @@
+# valutatrade_hub/core/rates.py
+import time
+from array import array
+from copy import copy
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+from ..infra.database import db
+from ..infra.settings import settings
+
+try:
+    import numpy as np
+except ImportError:  # numpy необязателен - матрица хранится в array('d')
+    np = None
+
+PIVOT_CURRENCY = 'USD'
+
+# Версия формата rates.json:
+# {"schema_version": 2, "timestamp", "source", "base_currency",
+#  "rates": {пара: курс}, "pair_timestamps": {пара: время}, "pair_sources": {пара: источник}}
+RATES_SCHEMA_VERSION = 2
+
+# Поля снимка, не влияющие на курсы (with_meta)
+META_FIELDS = frozenset({'timestamp', 'source', 'version'})
+
+
+# Неизменяемый снимок курсов
+@dataclass(frozen=True)
+class RateSnapshot:
+    '''
+    Снимок курсов: пара -> курс, время обновления, источник и версия файла,
+    а также время и источник последнего изменения каждой пары.
+    После создания не изменяется, поэтому читается из любых потоков без блокировок
+    '''
+    rates: Mapping[str, float] = field(default_factory=dict)
+    timestamp: Optional[str] = None
+    source: str = 'unknown'
+    version: Any = None
+    base_currency: str = PIVOT_CURRENCY
+    pair_timestamps: Mapping[str, str] = field(default_factory=dict)
+    pair_sources: Mapping[str, str] = field(default_factory=dict)
+    
+    # Матрица кросс-курсов N x N: matrix[i * N + j] = курс currencies[i] -> currencies[j]
+    currencies: Tuple[str, ...] = field(init=False, repr=False, compare=False)
+    _index: Mapping[str, int] = field(init=False, repr=False, compare=False)
+    _matrix: Any = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, 'rates', MappingProxyType(dict(self.rates)))
+        object.__setattr__(self, 'pair_timestamps', MappingProxyType(dict(self.pair_timestamps)))
+        object.__setattr__(self, 'pair_sources', MappingProxyType(dict(self.pair_sources)))
+        self._build_matrix()
+    
+    def _build_matrix(self):
+        '''
+        Построение матрицы кросс-курсов через котировки к USD (X_USD и USD_X)
+        '''
+        usd_prices = {PIVOT_CURRENCY: 1.0}
+        for pair, rate in self.rates.items():
+            from_currency, _, to_currency = pair.partition('_')
+            if not rate:
+                continue
+            if to_currency == PIVOT_CURRENCY:
+                usd_prices[from_currency] = float(rate)
+            elif from_currency == PIVOT_CURRENCY:
+                usd_prices.setdefault(to_currency, 1 / float(rate))
+        
+        currencies = tuple(sorted(usd_prices))
+        prices = [usd_prices[code] for code in currencies]
+        if np is not None:
+            vector = np.array(prices, dtype=float)
+            matrix = np.divide.outer(vector, vector)
+        else:
+            matrix = array('d', (price_from / price_to for price_from in prices for price_to in prices))
+        
+        object.__setattr__(self, 'currencies', currencies)
+        object.__setattr__(self, '_index', MappingProxyType({code: i for i, code in enumerate(currencies)}))
+        object.__setattr__(self, '_matrix', matrix)
+    
+    def cross_rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        '''
+        Курс from -> to: прямая котировка, обратная или кросс-курс через USD (None если не найден)
+        '''
+        rate = self.rates.get(f'{from_currency}_{to_currency}')
+        if rate is not None:
+            return rate
+        
+        reverse_rate = self.rates.get(f'{to_currency}_{from_currency}')
+        if reverse_rate:
+            return 1 / reverse_rate
+        
+        i = self._index.get(from_currency)
+        j = self._index.get(to_currency)
+        if i is None or j is None:
+            return None
+        if np is not None:
+            return float(self._matrix[i, j])
+        return self._matrix[i * len(self.currencies) + j]
+    
+    def cross_rates(self, pairs: Iterable[Union[str, Tuple[str, str]]]) -> Dict[str, Optional[float]]:
+        '''
+        Курсы для многих пар за один вызов ('BTC_EUR' или ('BTC', 'EUR'))
+        '''
+        result = {}
+        for pair in pairs:
+            from_currency, to_currency = pair.split('_', 1) if isinstance(pair, str) else pair
+            result[f'{from_currency}_{to_currency}'] = self.cross_rate(from_currency, to_currency)
+        return result
+    
+    @classmethod
+    def from_rates_data(cls, rates_data: Optional[Dict[str, Any]], version: Any = None) -> 'RateSnapshot':
+        '''
+        Создание снимка из содержимого rates.json (единственный разбор формата)
+        '''
+        rates_data = rates_data or {}
+        if rates_data.get('schema_version') != RATES_SCHEMA_VERSION:
+            return cls._from_legacy(rates_data, version)
+        
+        return cls(
+            rates=rates_data['rates'],
+            timestamp=rates_data.get('timestamp'),
+            source=rates_data.get('source', 'unknown'),
+            version=version,
+            base_currency=rates_data.get('base_currency', PIVOT_CURRENCY),
+            pair_timestamps=rates_data.get('pair_timestamps', {}),
+            pair_sources=rates_data.get('pair_sources', {})
+        )
+    
+    @classmethod
+    def _from_legacy(cls, rates_data: Dict[str, Any], version: Any) -> 'RateSnapshot':
+        '''
+        Чтение файлов до версии 2 (раскладки rates/timestamp и pairs/last_refresh);
+        при следующей записи файл сохраняется в текущем формате
+        '''
+        timestamp = rates_data.get('timestamp') or rates_data.get('last_refresh')
+        source = rates_data.get('source', 'unknown')
+        rates, pair_timestamps, pair_sources = {}, {}, {}
+        for pair, info in (rates_data.get('pairs') or {}).items():
+            if info.get('rate') is not None:
+                rates[pair] = info['rate']
+                pair_timestamps[pair] = info.get('updated_at', timestamp)
+                pair_sources[pair] = info.get('source', source)
+        for pair, rate in (rates_data.get('rates') or {}).items():
+            if rate is not None:
+                rates[pair] = rate
+                pair_timestamps[pair] = timestamp
+                pair_sources[pair] = source
+        
+        return cls(
+            rates=rates,
+            timestamp=timestamp,
+            source=source,
+            version=version,
+            base_currency=rates_data.get('base_currency', PIVOT_CURRENCY),
+            pair_timestamps=pair_timestamps,
+            pair_sources=pair_sources
+        )
+    
+    def to_rates_data(self) -> Dict[str, Any]:
+        '''
+        Содержимое rates.json для снимка (единственная запись формата)
+        '''
+        return {
+            'schema_version': RATES_SCHEMA_VERSION,
+            'timestamp': self.timestamp,
+            'source': self.source,
+            'base_currency': self.base_currency,
+            'rates': dict(self.rates),
+            'pair_timestamps': dict(self.pair_timestamps),
+            'pair_sources': dict(self.pair_sources)
+        }
+    
+    def with_meta(self, **meta: Any) -> 'RateSnapshot':
+        '''
+        Копия снимка с другими timestamp / source / version: курсы те же,
+        поэтому матрица кросс-курсов переиспользуется, а не строится заново (O(N^2))
+        '''
+        unknown = set(meta) - META_FIELDS
+        if unknown:
+            raise ValueError(f'Ошибка: with_meta не меняет поля {", ".join(sorted(unknown))}')
+        snapshot = copy(self)
+        for name, value in meta.items():
+            object.__setattr__(snapshot, name, value)
+        return snapshot
+    
+    def updated(self, changes: Dict[str, float], pair_sources: Dict[str, str],
+                timestamp: str, source: str) -> 'RateSnapshot':
+        '''
+        Новый снимок: курсы changes поверх текущих, остальные пары без изменений
+        '''
+        return RateSnapshot(
+            rates={**self.rates, **changes},
+            timestamp=timestamp,
+            source=source,
+            base_currency=self.base_currency,
+            pair_timestamps={**self.pair_timestamps, **{pair: timestamp for pair in changes}},
+            pair_sources={**self.pair_sources, **{pair: pair_sources.get(pair, source) for pair in changes}}
+        )
+    
+    def value(self, codes: Sequence[str], balances: Sequence[float], base_currency: str) -> Tuple[List[Optional[float]], List[float]]:
+        '''
+        Оценка балансов в базовой валюте: курс каждой валюты считается один раз,
+        стоимости - поэлементным умножением (векторным, если установлен numpy).
+        Возвращает курсы (None если курс не найден) и стоимости (0.0 без курса)
+        '''
+        rate_by_code = {code: self.cross_rate(code, base_currency) for code in set(codes)}
+        rate_by_code[base_currency] = 1.0
+        rates = [rate_by_code[code] for code in codes]
+        factors = [rate if rate is not None else 0.0 for rate in rates]
+        
+        if np is not None:
+            values = (np.asarray(balances, dtype=float) * np.asarray(factors, dtype=float)).tolist()
+        else:
+            values = [float(balance) * factor for balance, factor in zip(balances, factors)]
+        return rates, values
+    
+    @property
+    def updated_at(self) -> Optional[datetime]:
+        if not self.timestamp:
+            return None
+        try:
+            return datetime.fromisoformat(self.timestamp)
+        except (ValueError, TypeError):
+            return None
+    
+    def age_seconds(self) -> Optional[float]:
+        '''
+        Возраст снимка в секундах (None если время неизвестно)
+        '''
+        updated_at = self.updated_at
+        if updated_at is None:
+            return None
+        return (datetime.now() - updated_at).total_seconds()
+
+
+# Текущий опубликованный снимок курсов
+class RateSnapshotStore:
+    '''
+    Хранит ссылку на текущий RateSnapshot.
+    Обновитель публикует новый снимок одной заменой ссылки, читатели берут
+    текущий без файлового ввода-вывода; версия rates.json на диске проверяется
+    не чаще раза в rates_snapshot_check_seconds и файл перечитывается только при ее изменении
+    '''
+    
+    def __init__(self):
+        self._snapshot: Optional[RateSnapshot] = None
+        self._checked_at = 0.0
+        self.check_interval = settings.get('rates_snapshot_check_seconds', 1.0)
+    
+    def current(self) -> RateSnapshot:
+        '''
+        Текущий снимок курсов
+        '''
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - self._checked_at >= self.check_interval:
+            snapshot = self.refresh()
+        return snapshot
+    
+    def refresh(self) -> RateSnapshot:
+        '''
+        Перечитывание rates.json, если его версия изменилась
+        '''
+        self._checked_at = time.monotonic()
+        snapshot = self._snapshot
+        version = db.version('rates')
+        if snapshot is not None and version is not None and snapshot.version == version:
+            return snapshot
+        
+        rates_data = db.load_data('rates')
+        if rates_data is None and snapshot is not None:
+            # Файл недоступен - продолжаем отдавать последний снимок
+            return snapshot
+        
+        snapshot = RateSnapshot.from_rates_data(rates_data, version)
+        self._snapshot = snapshot
+        return snapshot
+    
+    def save(self, snapshot: RateSnapshot) -> RateSnapshot:
+        '''
+        Запись снимка в rates.json и его публикация (единственный путь записи курсов)
+        '''
+        db.save_data('rates', snapshot.to_rates_data())
+        snapshot = snapshot.with_meta(version=db.version('rates'))
+        self.publish(snapshot)
+        return snapshot
+    
+    def publish(self, snapshot: RateSnapshot):
+        '''
+        Публикация нового снимка (атомарная замена ссылки)
+        '''
+        self._snapshot = snapshot
+        self._checked_at = time.monotonic()
+
+
+# Глобальный экземпляр снимков курсов
+rate_snapshots = RateSnapshotStore()
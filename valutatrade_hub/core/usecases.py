@@ -1,10 +1,11 @@
 # valutatrade_hub/core/usecases.py
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from valutatrade_hub.decorators import log_action
 
 from ..infra.database import db
+from ..infra.portfolio_store import get_portfolio_store
 from ..infra.settings import settings
 from .currencies import get_currency
 from .exceptions import (
@@ -16,6 +17,7 @@ from .exceptions import (
     UserNotFoundError,
 )
 from .models import Portfolio, User, Wallet
+from .rates import rate_snapshots
 
 
 class UserManager:
@@ -30,49 +32,40 @@ class UserManager:
         if len(password) < 4:
             raise UsernamePasswordError()
         
-        users_data = db.load_data('users') or []
-        
-        if any(user['username'] == username for user in users_data):
-            raise UsernameTakenError(username)
-        
         try:
-            if users_data:
-                user_id = max([user['user_id'] for user in users_data]) + 1
-            else:
-                user_id = 1
+            user = None
             
-
-            user = User(user_id, username, password)
-            
-            user_data = {
-                'user_id': user.user_id,
-                'username': user.username,
-                'hashed_password': user._hashed_password,
-                'salt': user._salt,
-                'registration_date': user.registration_date.isoformat()
-            }
+            def make_user_record(user_id: int) -> Dict[str, Any]:
+                nonlocal user
+                user = User(user_id, username, password)
+                return {
+                    'user_id': user.user_id,
+                    'username': user.username,
+                    'hashed_password': user._hashed_password,
+                    'salt': user._salt,
+                    'registration_date': user.registration_date.isoformat()
+                }
             
-            def update_users(users):
-                users.append(user_data)
-                return users
-            
-            db.update_data('users', update_users)
-            self._create_portfolio(user_id)
-            return user
+            # Проверка имени, выдача id и запись - под одной блокировкой users
+            user_data = db.insert('users', 'user_id', make_user_record, unique=('username', username))
+            if user_data is not None:
+                self._create_portfolio(user.user_id)
             
         except Exception:
             import traceback
             traceback.print_exc()
             raise
         
+        if user_data is None:
+            raise UsernameTakenError(username)
+        return user
+        
     @log_action('login')
     def login(self, username: str, password: str) -> User:
         '''
         Вход пользователя
         '''
-        users_data = db.load_data('users') or []
-        
-        user_data = next((u for u in users_data if u['username'] == username), None)
+        user_data = db.find_one('users', 'username', username)
         if not user_data:
             raise UserNotFoundError(username)
         
@@ -106,18 +99,7 @@ class UserManager:
         '''
         Создание пустого портфеля для пользователя
         '''
-        portfolio_data = db.load_data('portfolios') or []
-        
-        portfolio_data = {
-            'user_id': user_id,
-            'wallets': {'USD': {'balance': 10000.0}}
-        }
-        
-        def update_portfolios(portfolios):
-            portfolios.append(portfolio_data)
-            return portfolios
-        
-        db.update_data('portfolios', update_portfolios)
+        get_portfolio_store().put(user_id, {'USD': {'balance': 10000.0}})
 
 class PortfolioManager:
     @log_action('BUY', verbose=True)
@@ -210,46 +192,70 @@ class PortfolioManager:
         '''
         Получение портфеля пользователя
         '''
-        portfolios_data = db.load_data('portfolios') or []
-        
-        portfolio_data = next((p for p in portfolios_data if p['user_id'] == user_id), None)
-        if not portfolio_data:
+        wallets_data = get_portfolio_store().get(user_id)
+        if not wallets_data:
             raise ValueError(f'Портфель для пользователя {user_id} не найден')
         
         wallets = {}
-        for currency_code, wallet_data in portfolio_data['wallets'].items():
+        for currency_code, wallet_data in wallets_data.items():
             wallets[currency_code] = Wallet(currency_code, wallet_data['balance'])
         
         return Portfolio(user_id, wallets)
     
+    def value_portfolio(self, user_id: int, base_currency: str = 'USD') -> Dict[str, Any]:
+        '''
+        Оценка всех кошельков пользователя в базовой валюте по одному снимку курсов
+        '''
+        valuation = self.value_portfolios([user_id], base_currency).get(user_id)
+        if valuation is None:
+            raise ValueError(f'Портфель для пользователя {user_id} не найден')
+        return valuation
+    
+    def value_portfolios(self, user_ids: List[int], base_currency: str = 'USD') -> Dict[int, Dict[str, Any]]:
+        '''
+        Пакетная оценка портфелей многих пользователей (для отчетов).
+        Пользователи без портфеля пропускаются
+        '''
+        store = get_portfolio_store()
+        owners, codes, balances = [], [], []
+        for user_id in user_ids:
+            wallets_data = store.get(user_id)
+            if not wallets_data:
+                continue
+            for currency_code, wallet_data in wallets_data.items():
+                owners.append(user_id)
+                codes.append(currency_code)
+                balances.append(wallet_data['balance'])
+        
+        snapshot = rate_snapshots.current()
+        rates, values = snapshot.value(codes, balances, base_currency)
+        
+        valuations: Dict[int, Dict[str, Any]] = {}
+        for user_id, currency_code, balance, rate, value in zip(owners, codes, balances, rates, values):
+            valuation = valuations.setdefault(user_id, {
+                'user_id': user_id,
+                'base_currency': base_currency,
+                'wallets': {},
+                'total': 0.0,
+                'missing_rates': []
+            })
+            valuation['wallets'][currency_code] = {'balance': balance, 'rate': rate, 'value': value}
+            valuation['total'] += value
+            if rate is None:
+                valuation['missing_rates'].append(currency_code)
+        return valuations
+    
     def save_portfolio(self, portfolio: Portfolio):
         '''
         Сохранение портфеля
         '''
-        def update_portfolios(portfolios_data):
-            for i, portfolio_data in enumerate(portfolios_data):
-                if portfolio_data['user_id'] == portfolio.user_id:
-                    wallets_data = {}
-                    for currency_code, wallet in portfolio.wallets.items():
-                        wallets_data[currency_code] = {
-                            'balance': wallet.balance
-                        }
-                    portfolios_data[i]['wallets'] = wallets_data
-                    break
-            else:
-                wallets_data = {}
-                for currency_code, wallet in portfolio.wallets.items():
-                    wallets_data[currency_code] = {
-                        'balance': wallet.balance
-                    }
-                portfolios_data.append({
-                    'user_id': portfolio.user_id,
-                    'wallets': wallets_data
-                })
-            
-            return portfolios_data
+        wallets_data = {}
+        for currency_code, wallet in portfolio.wallets.items():
+            wallets_data[currency_code] = {
+                'balance': wallet.balance
+            }
         
-        db.update_data('portfolios', update_portfolios)
+        get_portfolio_store().put(portfolio.user_id, wallets_data)
 
 
 class RateManager:
@@ -261,17 +267,8 @@ class RateManager:
         '''
         Проверяет, актуальны ли данные о курсах валют
         '''
-        rates_data = db.load_data('rates') or {}
-        
-        if not rates_data.get('timestamp'):
-            return False
-        
-        try:
-            last_update = datetime.fromisoformat(rates_data['timestamp'])
-            time_diff = datetime.now() - last_update
-            return time_diff.total_seconds() < self.rates_ttl
-        except (ValueError, TypeError):
-            return False
+        age = rate_snapshots.current().age_seconds()
+        return age is not None and age < self.rates_ttl
     
     def is_currency_info_fresh(self) -> bool:
         '''
@@ -297,48 +294,43 @@ class RateManager:
         if from_currency == to_currency:
             print('Ошибка: Данной валюты не существует')
         
-        rates_data = db.load_data('rates') or {'rates': {}, 'timestamp': None}
-        rates = rates_data.get('rates', {})
-        
-        direct_pair = f'{from_currency}_{to_currency}'
-        if direct_pair in rates:
-            rate = rates[direct_pair]
-            return rate
-        
-        reverse_pair = f'{to_currency}_{from_currency}'
-        if reverse_pair in rates:
-            reverse_rate = rates[reverse_pair]
-            rate = 1 / reverse_rate
+        rate = rate_snapshots.current().cross_rate(from_currency, to_currency)
+        if rate is not None:
             return rate
         
         raise CurrencyNotFoundError(
            f'Ошибка: Курс для пары {from_currency}/{to_currency} не найден. '
            f'Проверьте доступные валюты или обновите данные.'
         )
+    
+    def get_rates_bulk(self, pairs: List[Union[str, Tuple[str, str]]]) -> Dict[str, Optional[float]]:
+        '''
+        Получение курсов для списка пар одним вызовом по одному снимку курсов.
+        Пары задаются как 'BTC_EUR' или ('BTC', 'EUR'), для ненайденных возвращается None
+        '''
+        return rate_snapshots.current().cross_rates(pairs)
       
     def get_rates_age(self) -> str:
         '''
         Возвращает возраст данных о курсах в читаемом формате
         '''
-        rates_data = db.load_data('rates') or {}
+        snapshot = rate_snapshots.current()
         
-        if not rates_data.get('timestamp'):
+        if not snapshot.timestamp:
             return 'данные отсутствуют'
         
-        try:
-            last_update = datetime.fromisoformat(rates_data['timestamp'])
-            time_diff = datetime.now() - last_update
-            minutes = int(time_diff.total_seconds() // 60)
-            
-            if minutes < 1:
-                return 'только что'
-            elif minutes < 60:
-                return f'{minutes} минут назад'
-            else:
-                hours = minutes // 60
-                return f'{hours} часов назад'
-        except (ValueError, TypeError):
+        age = snapshot.age_seconds()
+        if age is None:
             return 'неизвестно'
+        
+        minutes = int(age // 60)
+        if minutes < 1:
+            return 'только что'
+        elif minutes < 60:
+            return f'{minutes} минут назад'
+        else:
+            hours = minutes // 60
+            return f'{hours} часов назад'
     
     def _get_simple_stub_rate(self, from_currency: str, to_currency: str) -> float:
         '''
@@ -1,9 +1,13 @@
 # valutatrade_hub/infra/database.py
+import atexit
 import json
 import os
-from threading import Lock
-from typing import Any
+import tempfile
+from threading import Timer
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from .indexes import IndexManager
+from .locks import CROSS_PROCESS, LockRegistry
 from .settings import settings
 
 
@@ -12,7 +16,6 @@ class DatabaseManager:
     Singleton для управления JSON-хранилищем
     '''
     _instance = None
-    _lock = Lock()
     
     def __new__(cls):
         if cls._instance is None:
@@ -27,9 +30,37 @@ class DatabaseManager:
         self.data_dir = settings.get('data_directory', 'data')
         os.makedirs(self.data_dir, exist_ok=True)
         
+        # Кеш сущностей: entity -> (mtime_ns, size, data)
+        self._cache: Dict[str, Tuple[int, int, Any]] = {}
+        
+        # Групповая запись: изменения сущности копятся в памяти group_commit_ms
+        # и записываются на диск одной физической записью. Все это время процесс
+        # удерживает блокировку сущности, поэтому без межпроцессных блокировок
+        # (Windows) групповая запись отключена
+        self.group_commit_window = settings.get('group_commit_ms', 0) / 1000 if CROSS_PROCESS else 0
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        atexit.register(self.flush)
+        
+        # Альтернативный бэкенд хранения (None - JSON-файлы в data_dir)
+        self._backend = None
+        if settings.get('storage_backend', 'json') == 'sqlite':
+            from .sqlite_backend import SqliteBackend
+            db_path = settings.get('sqlite_path') or os.path.join(self.data_dir, 'valutatrade.db')
+            self._backend = SqliteBackend(db_path)
+            return
+        
+        # Блокировки по сущностям (поток + процесс), чтобы запись курсов
+        # не ждала запись портфелей и наоборот
+        self._locks = LockRegistry(os.path.join(self.data_dir, '.locks'))
+        
+        # Индексы по ключевым полям списочных сущностей и последовательности id
+        self._indexes = IndexManager(os.path.join(self.data_dir, '.indexes.json'))
+        atexit.register(self._save_indexes)
+        
         self._ensure_file_exists('users.json', [])
         self._ensure_file_exists('portfolios.json', [])
-        self._ensure_file_exists('rates.json', {'pairs': {}, 'last_refresh': None})
+        # rates.json не создается: формат снимка определен только в core.rates,
+        # до первой записи курсов читатели получают пустой снимок
         self._ensure_file_exists('exchange_rates.json', [])
     
     def _ensure_file_exists(self, filename: str, default_data: Any):
@@ -52,21 +83,115 @@ class DatabaseManager:
     
     def _write_file(self, filepath: str, data: Any):
         '''
-        Запись в JSON файл
+        Атомарная запись в JSON файл: временный файл + fsync + os.replace.
+        Читатели видят либо старую, либо новую версию файла целиком
         '''
+        directory = os.path.dirname(filepath) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(filepath)}.', suffix='.tmp')
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, filepath)
         except Exception as e:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
             raise IOError(f'Ошибка: Ошибка записи в файл {filepath}: {e}')
+        
+        self._fsync_directory(directory)
+    
+    def _fsync_directory(self, directory: str):
+        '''
+        Сброс на диск записи каталога о переименовании (только POSIX)
+        '''
+        if os.name != 'posix':
+            return
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+    
+    def _get_filepath(self, entity: str) -> str:
+        return os.path.join(self.data_dir, f'{entity}.json')
+    
+    def _file_signature(self, filepath: str) -> Optional[Tuple[int, int]]:
+        '''
+        Версия файла на диске (mtime + размер), None если файла нет
+        '''
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def _remember(self, entity: str, filepath: str, data: Any):
+        '''
+        Запоминание данных сущности в кеше вместе с версией файла
+        '''
+        signature = self._file_signature(filepath)
+        if signature is None:
+            self._cache.pop(entity, None)
+        else:
+            self._cache[entity] = (signature[0], signature[1], data)
     
     def load_data(self, entity: str) -> Any:
         '''
-        Загрузка данных по имени сущности
+        Загрузка данных по имени сущности.
+        Файл перечитывается только если изменились его mtime или размер,
+        иначе возвращается закешированный объект (его нельзя изменять напрямую -
+        для изменений используется update_data)
         '''
 
-        filepath = os.path.join(self.data_dir, f'{entity}.json')
+        if self._backend is not None:
+            return self._backend.load_data(entity)
+
+        pending = self._pending.get(entity)
+        if pending is not None:
+            return pending['data']
+
+        cached = self._cached(entity)
+        if cached is not None:
+            return cached
+        
+        with self._locks.get(entity).read():
+            return self._read_entity(entity)
+    
+    def _cached(self, entity: str) -> Any:
+        '''
+        Данные из кеша, если файл на диске не менялся, иначе None
+        '''
+        signature = self._file_signature(self._get_filepath(entity))
+        cached = self._cache.get(entity)
+        if cached is not None and signature is not None and cached[:2] == signature:
+            return cached[2]
+        return None
+    
+    def _read_entity(self, entity: str) -> Any:
+        '''
+        Чтение сущности с диска с обновлением кеша (блокировка уже захвачена)
+        '''
+        cached = self._cached(entity)
+        if cached is not None:
+            return cached
+        
+        filepath = self._get_filepath(entity)
+        signature = self._file_signature(filepath)
+        # Версия снята до чтения: если файл изменится во время чтения,
+        # следующая проверка увидит расхождение и перечитает его
         result = self._read_file(filepath)
+        if result is None or signature is None:
+            self._cache.pop(entity, None)
+        else:
+            self._cache[entity] = (signature[0], signature[1], result)
         return result
     
     def save_data(self, entity: str, data: Any):
@@ -74,23 +199,241 @@ class DatabaseManager:
         Сохранение данных по имени сущности
         '''
 
-        filepath = os.path.join(self.data_dir, f'{entity}.json')
-        self._write_file(filepath, data)
+        if self._backend is not None:
+            self._backend.save_data(entity, data)
+            return
+
+        with self._locks.get(entity).write():
+            # Полная перезапись отменяет накопленные групповые изменения
+            self._cancel_pending(entity)
+            try:
+                self._write_entity(entity, data)
+            finally:
+                self._locks.get(entity).release()
+    
+    def _write_entity(self, entity: str, data: Any):
+        filepath = self._get_filepath(entity)
+        try:
+            self._write_file(filepath, data)
+        except Exception:
+            self._cache.pop(entity, None)
+            raise
+        self._remember(entity, filepath, data)
+    
+    def version(self, entity: str) -> Optional[Tuple[int, int]]:
+        '''
+        Версия данных сущности на диске (None если недоступна или бэкенд не JSON)
+        '''
+        if self._backend is not None or entity in self._pending:
+            return None
+        return self._file_signature(self._get_filepath(entity))
+    
+    def invalidate(self, entity: Optional[str] = None):
+        '''
+        Сброс кеша одной сущности или всего кеша
+        '''
+        if entity is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(entity, None)
         
     def update_data(self, entity: str, update_fn: callable) -> Any:
         '''
         Атомарное обновление данных
         '''       
-        with self._lock:            
+        if self._backend is not None:
+            return self._backend.update_data(entity, update_fn)
+
+        with self._locks.get(entity).write():
             try:
-                data = self.load_data(entity)
+                if self.group_commit_window > 0:
+                    return self._update_grouped(entity, update_fn)
+                data = self._read_entity(entity)
                 updated_data = update_fn(data)
-                self.save_data(entity, updated_data)
+                self._write_entity(entity, updated_data)
                 return updated_data                
             except Exception:
+                # update_fn мог частично изменить закешированный объект
+                self.invalidate(entity)
+                if entity in self._pending:
+                    self._pending[entity]['data'] = self._replay(entity, self._pending[entity]['fns'])
                 import traceback
                 traceback.print_exc()
                 raise
+    
+    def _update_grouped(self, entity: str, update_fn: Callable) -> Any:
+        '''
+        Применение изменения в памяти с отложенной записью на диск.
+        Блокировка сущности между процессами удерживается до flush: другие процессы
+        не изменят файл, пока результаты накопленных изменений уже выданы вызывающим
+        '''
+        pending = self._pending.get(entity)
+        if pending is None:
+            data = self._read_entity(entity)
+            cached = self._cache.get(entity)
+            pending = {
+                'fns': [],
+                'signature': cached[:2] if cached else None,
+                'timer': Timer(self.group_commit_window, self.flush, args=(entity,))
+            }
+            pending['timer'].daemon = True
+        else:
+            data = pending['data']
+        
+        updated_data = update_fn(data)
+        pending['data'] = updated_data
+        pending['fns'].append(update_fn)
+        
+        if entity not in self._pending:
+            self._pending[entity] = pending
+            self._locks.get(entity).hold()
+            pending['timer'].start()
+        return updated_data
+    
+    def _replay(self, entity: str, fns: List[Callable]) -> Any:
+        '''
+        Повторное применение накопленных изменений к актуальным данным с диска
+        '''
+        self.invalidate(entity)
+        data = self._read_file(self._get_filepath(entity))
+        for update_fn in fns:
+            data = update_fn(data)
+        return data
+    
+    def _cancel_pending(self, entity: str):
+        pending = self._pending.pop(entity, None)
+        if pending is not None:
+            pending['timer'].cancel()
+    
+    def flush(self, entity: Optional[str] = None):
+        '''
+        Запись накопленных групповых изменений (одной сущности или всех)
+        '''
+        entities = [entity] if entity is not None else list(self._pending)
+        for name in entities:
+            with self._locks.get(name).write():
+                pending = self._pending.pop(name, None)
+                if pending is None:
+                    continue
+                pending['timer'].cancel()
+                
+                try:
+                    if self._file_signature(self._get_filepath(name)) != pending['signature']:
+                        # Под удержанной блокировкой такого быть не должно: выданные вызывающим
+                        # результаты (id, проверки уникальности) могли устареть
+                        self.invalidate(name)
+                        raise IOError(
+                            f'Ошибка: Файл {name}.json изменен в обход блокировки во время групповой записи, '
+                            f'{len(pending["fns"])} изменений отброшено'
+                        )
+                    self._write_entity(name, pending['data'])
+                finally:
+                    self._locks.get(name).release()
+    
+    def find_one(self, entity: str, field: str, value: Any) -> Optional[Dict]:
+        '''
+        Поиск одной записи списочной сущности по значению поля (через индекс)
+        '''
+        if self._backend is not None:
+            return self._backend.find_one(entity, field, value)
+        
+        records = self.load_data(entity) or []
+        return self._index(entity, field, records).find(records, value)
+    
+    def upsert(self, entity: str, field: str, record: Dict):
+        '''
+        Замена записи с тем же значением ключевого поля или добавление новой
+        '''
+        if self._backend is not None:
+            self._backend.upsert(entity, field, record)
+            return
+        
+        def update_records(records):
+            records = records or []
+            position = self._index(entity, field, records).position(records, record[field])
+            if position is not None:
+                records[position] = record
+            else:
+                records.append(record)
+            return records
+        
+        self.update_data(entity, update_records)
+    
+    def append(self, entity: str, records: List[Dict], max_records: Optional[int] = None, since: Optional[str] = None):
+        '''
+        Дозапись записей в списочную сущность с обрезкой: остаются записи с timestamp (ISO) не раньше since
+        и не более max_records последних. В SQLite - построчные INSERT без перезаписи таблицы
+        '''
+        if self._backend is not None:
+            self._backend.append(entity, records, max_records, since)
+            return
+        
+        def update_records(existing):
+            existing = (existing or []) + records
+            if since is not None:
+                existing = [record for record in existing if isinstance(record.get('timestamp'), str) and record['timestamp'] >= since]
+            if max_records is not None:
+                existing = existing[-max_records:]
+            return existing
+        
+        self.update_data(entity, update_records)
+    
+    def insert(self, entity: str, field: str, make_record: Callable[[int], Dict],
+               unique: Optional[Tuple[str, Any]] = None) -> Optional[Dict]:
+        '''
+        Добавление записи с новым идентификатором field: проверка уникального поля
+        unique = (поле, значение), выдача id и вставка выполняются под одной блокировкой записи
+        (в SQLite - одна транзакция со вставкой одной строки; при групповой записи
+        блокировка удерживается до физической записи).
+        make_record(id) строит запись; None если запись с таким значением unique уже есть
+        '''
+        if self._backend is not None:
+            return self._backend.insert(entity, field, make_record, unique)
+        
+        inserted = None
+        applied = False
+        
+        def update_records(records):
+            nonlocal inserted, applied
+            records = records or []
+            duplicate = unique is not None and self._index(entity, unique[0], records).position(records, unique[1]) is not None
+            if applied:
+                # Повторное применение после отката группы: результат уже выдан вызывающему
+                # и обязан остаться тем же - иначе ошибка, а не тихая подмена
+                taken = inserted is not None and self._index(entity, field, records).position(records, inserted[field]) is not None
+                if duplicate != (inserted is None) or taken:
+                    raise IOError(f'Ошибка: Повторное применение вставки в {entity} дало другой результат')
+            elif not duplicate:
+                inserted = make_record(self._indexes.next_id(entity, self._index(entity, field, records).max(records)))
+            applied = True
+            
+            if inserted is not None:
+                records.append(inserted)
+            return records
+        
+        self.update_data(entity, update_records)
+        return inserted
+    
+    def _index(self, entity: str, field: str, records: List[Dict]):
+        cached = self._cache.get(entity)
+        signature = cached[:2] if cached is not None and cached[2] is records else None
+        return self._indexes.get(entity, field, records, signature)
+    
+    def _save_indexes(self):
+        '''
+        Сохранение индексов при выходе (для версий файлов, совпадающих с кешем)
+        '''
+        if self._backend is not None:
+            return
+        self.flush()
+        snapshots = {}
+        for entity, (mtime_ns, size, data) in list(self._cache.items()):
+            if isinstance(data, list) and self._file_signature(self._get_filepath(entity)) == (mtime_ns, size):
+                snapshots[entity] = ((mtime_ns, size), data)
+        try:
+            self._indexes.save(snapshots)
+        except OSError:
+            pass
 
 # Глобальный экземпляр базы данных
-db = DatabaseManager()
\ No newline at end of file
+db = DatabaseManager()
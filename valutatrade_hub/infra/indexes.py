@@ -0,0 +1,157 @@
+# valutatrade_hub/infra/indexes.py
+import json
+import os
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Индекс списочной сущности по одному полю
+class RecordIndex:
+    '''
+    Отображение значение поля -> позиция записи в закешированном списке.
+    Привязан к конкретному объекту списка: при подмене списка (перечитывание файла)
+    перестраивается, дописанные в конец записи индексируются инкрементально
+    '''
+    
+    def __init__(self, field: str):
+        self.field = field
+        self.positions: Dict[Any, int] = {}
+        self.max_value: Optional[Any] = None
+        self._records_id: Optional[int] = None
+        self._indexed_len = 0
+    
+    def _sync(self, records: List[Dict]):
+        '''
+        Приведение индекса в соответствие со списком записей
+        '''
+        if self._records_id != id(records) or len(records) < self._indexed_len:
+            self.positions = {}
+            self.max_value = None
+            self._records_id = id(records)
+            self._indexed_len = 0
+        
+        for position in range(self._indexed_len, len(records)):
+            self._add(records[position], position)
+        self._indexed_len = len(records)
+    
+    def _add(self, record: Dict, position: int):
+        value = record.get(self.field)
+        self.positions[value] = position
+        if value is not None and (self.max_value is None or value > self.max_value):
+            self.max_value = value
+    
+    def adopt(self, records: List[Dict], positions: Dict[Any, int], max_value: Any):
+        '''
+        Принятие сохраненного с прошлого запуска индекса для этого списка
+        '''
+        self.positions = positions
+        self.max_value = max_value
+        self._records_id = id(records)
+        self._indexed_len = len(records)
+    
+    def position(self, records: List[Dict], value: Any) -> Optional[int]:
+        '''
+        Позиция записи с данным значением поля (None если такой нет)
+        '''
+        self._sync(records)
+        position = self.positions.get(value)
+        if position is None:
+            return None
+        if position >= len(records) or records[position].get(self.field) != value:
+            # Список изменили на месте (удаление/перестановка) - полная перестройка
+            self._records_id = None
+            self._sync(records)
+            position = self.positions.get(value)
+        return position
+    
+    def find(self, records: List[Dict], value: Any) -> Optional[Dict]:
+        position = self.position(records, value)
+        return records[position] if position is not None else None
+    
+    def max(self, records: List[Dict]) -> Optional[Any]:
+        self._sync(records)
+        return self.max_value
+
+
+# Индексы и последовательности идентификаторов всех сущностей
+class IndexManager:
+    '''
+    Хранит индексы по (сущность, поле) и монотонные последовательности id.
+    Индексы и последовательности сохраняются в файл между запусками вместе с
+    версией (mtime, размер) файла данных - при совпадении версии индекс
+    принимается без перестроения
+    '''
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._indexes: Dict[Tuple[str, str], RecordIndex] = {}
+        self._sequences: Dict[str, int] = {}
+        self._persisted: Dict[str, Any] = {}
+        self._lock = Lock()
+        self._load()
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        self._sequences = stored.get('sequences', {})
+        self._persisted = stored.get('indexes', {})
+    
+    def get(self, entity: str, field: str, records: List[Dict], signature: Optional[Tuple[int, int]]) -> RecordIndex:
+        '''
+        Индекс сущности по полю для текущего списка записей
+        '''
+        key = (entity, field)
+        index = self._indexes.get(key)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(key)
+                if index is None:
+                    index = RecordIndex(field)
+                    self._restore(entity, index, records, signature)
+                    self._indexes[key] = index
+        return index
+    
+    def _restore(self, entity: str, index: RecordIndex, records: List[Dict], signature: Optional[Tuple[int, int]]):
+        stored = self._persisted.get(f'{entity}.{index.field}')
+        if not stored or signature is None or stored.get('signature') != list(signature):
+            return
+        # Ключи JSON - строки, восстанавливаем исходный тип значений
+        value_type = type(stored['max_value']) if stored.get('max_value') is not None else str
+        positions = {value_type(value): position for value, position in stored['positions'].items()}
+        index.adopt(records, positions, stored.get('max_value'))
+    
+    def next_id(self, entity: str, current_max: Optional[int]) -> int:
+        '''
+        Следующий id сущности: никогда не повторяется, даже если записи удаляли
+        '''
+        with self._lock:
+            next_value = max(self._sequences.get(entity, 0), current_max or 0) + 1
+            self._sequences[entity] = next_value
+            return next_value
+    
+    def save(self, snapshots: Dict[str, Tuple[Tuple[int, int], List[Dict]]]):
+        '''
+        Сохранение индексов и последовательностей на диск.
+        snapshots: сущность -> (версия файла, закешированный список этой версии)
+        '''
+        indexes = {}
+        for (entity, field), index in self._indexes.items():
+            if entity not in snapshots:
+                continue
+            signature, records = snapshots[entity]
+            if index._records_id != id(records):
+                continue
+            index._sync(records)
+            indexes[f'{entity}.{field}'] = {
+                'signature': list(signature),
+                'max_value': index.max_value,
+                'positions': index.positions
+            }
+        
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'sequences': self._sequences, 'indexes': indexes}, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
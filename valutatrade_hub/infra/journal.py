@@ -0,0 +1,219 @@
+# valutatrade_hub/infra/journal.py
+import atexit
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows - защита от второго писателя недоступна
+    fcntl = None
+
+from ..logging_config import get_logger
+from .database import db
+from .settings import settings
+
+
+# Журналируемое хранилище портфелей: снапшот portfolios.json + журнал изменений
+class JournaledPortfolioStore:
+    '''
+    Каждая сделка дописывает в portfolios.journal одну строку с новыми
+    кошельками пользователя, вместо перезаписи всего portfolios.json.
+    Фоновая компакция сворачивает журнал в новый снапшот.
+    При старте состояние = снапшот + повтор журнала.
+    Записи журнала идемпотентны (полное состояние кошельков пользователя),
+    поэтому повторное применение после сбоя во время компакции безопасно.
+    Рассчитано на один процесс-писатель: журнал захватывается эксклюзивным flock,
+    второй процесс в режиме journal получает ошибку при старте
+    '''
+    
+    def __init__(self):
+        self.logger = get_logger('journal')
+        self.journal_path = os.path.join(db.data_dir, 'portfolios.journal')
+        self.compacting_path = self.journal_path + '.compacting'
+        self._writer_fd = self._acquire_writer_lock(self.journal_path + '.lock')
+        self.compact_threshold = settings.get('journal_compact_threshold', 1000)
+        self.compact_interval = settings.get('journal_compact_interval_seconds', 60)
+        self.fsync = settings.get('journal_fsync', True)
+        
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._state: Dict[int, Dict[str, Any]] = {}
+        self._pending = 0
+        self._recover()
+        
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        if self._pending:
+            self.compact()
+        
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._compaction_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def _acquire_writer_lock(self, lock_path: str) -> Optional[int]:
+        '''
+        Эксклюзивная блокировка журнала на все время работы процесса
+        '''
+        if fcntl is None:
+            return None
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise RuntimeError(
+                'Ошибка: Журнал портфелей уже используется другим процессом '
+                '(режим journal допускает только один процесс-писатель)'
+            )
+        return fd
+    
+    def _recover(self):
+        '''
+        Восстановление состояния: снапшот + журнал незавершенной компакции + текущий журнал
+        '''
+        for portfolio_data in db.load_data('portfolios') or []:
+            self._state[portfolio_data['user_id']] = portfolio_data['wallets']
+        
+        for path in (self.compacting_path, self.journal_path):
+            # Оборванная последняя строка отрезается до повтора, иначе следующая
+            # запись (или склейка журналов при компакции) продолжит ее
+            self._truncate_torn_tail(path)
+            self._pending += self._replay(path)
+        
+        if self._pending:
+            self.logger.info(f'Replayed {self._pending} journal records')
+    
+    def _truncate_torn_tail(self, path: str):
+        '''
+        Обрезка файла журнала по последнему переводу строки
+        '''
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            position = size
+            while position > 0:
+                step = min(4096, position)
+                f.seek(position - step)
+                chunk = f.read(step)
+                newline = chunk.rfind(b'\n')
+                if newline != -1:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position != size:
+                self.logger.warning(f'Truncating torn record at the end of {path}')
+                f.truncate(position)
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def _replay(self, path: str) -> int:
+        '''
+        Применение записей журнала к состоянию, возвращает число записей
+        '''
+        if not os.path.exists(path):
+            return 0
+        
+        applied = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная строка после сбоя во время записи
+                    self.logger.warning(f'Skipping torn record in {path}')
+                    continue
+                self._state[record['user_id']] = record['wallets']
+                applied += 1
+        return applied
+    
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        '''
+        Получение кошельков пользователя (None если портфеля нет)
+        '''
+        return self._state.get(user_id)
+    
+    def put(self, user_id: int, wallets: Dict[str, Any]):
+        '''
+        Дозапись изменения портфеля в журнал
+        '''
+        line = json.dumps({'user_id': user_id, 'wallets': wallets}, ensure_ascii=False, default=str) + '\n'
+        
+        with self._lock:
+            self._journal.write(line)
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._state[user_id] = wallets
+            self._pending += 1
+            need_compaction = self._pending >= self.compact_threshold
+        
+        if need_compaction:
+            self._wakeup.set()
+    
+    def compact(self):
+        '''
+        Свертка журнала в новый снапшот portfolios.json
+        '''
+        with self._compact_lock:
+            with self._lock:
+                if not self._pending and not os.path.exists(self.compacting_path):
+                    return
+                # Текущий журнал откладывается, новые сделки идут в свежий файл
+                self._journal.close()
+                if os.path.exists(self.compacting_path):
+                    self._append_file(self.journal_path, self.compacting_path)
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, self.compacting_path)
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+                snapshot = [
+                    {'user_id': user_id, 'wallets': wallets}
+                    for user_id, wallets in self._state.items()
+                ]
+                folded = self._pending
+                self._pending = 0
+            
+            try:
+                db.save_data('portfolios', snapshot)
+            except Exception as e:
+                self.logger.error(f'Journal compaction failed: {e}')
+                with self._lock:
+                    self._pending += folded
+                return
+            
+            os.remove(self.compacting_path)
+            self.logger.info(f'Compacted {folded} journal records into portfolios.json')
+    
+    def _append_file(self, source: str, target: str):
+        '''
+        Дописывание содержимого журнала source в конец target
+        '''
+        with open(source, 'r', encoding='utf-8') as src, open(target, 'a', encoding='utf-8') as dst:
+            for line in src:
+                dst.write(line)
+    
+    def _compaction_loop(self):
+        '''
+        Фоновая компакция: по порогу числа записей или по интервалу
+        '''
+        while True:
+            self._wakeup.wait(self.compact_interval)
+            self._wakeup.clear()
+            try:
+                self.compact()
+            except Exception as e:
+                self.logger.error(f'Journal compaction error: {e}')
+    
+    def close(self):
+        '''
+        Закрытие журнала с финальной компакцией
+        '''
+        self.compact()
+        with self._lock:
+            self._journal.close()
+        if self._writer_fd is not None:
+            os.close(self._writer_fd)
+            self._writer_fd = None
@@ -0,0 +1,122 @@
+# valutatrade_hub/infra/locks.py
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows - только блокировки внутри процесса
+    fcntl = None
+
+# Исключают ли блокировки другие процессы (а не только потоки этого процесса)
+CROSS_PROCESS = fcntl is not None
+
+
+# Блокировка одной сущности хранилища
+class EntityLock:
+    '''
+    Блокировка сущности с семантикой читатель/писатель.
+    Между процессами - advisory flock на отдельном .lock файле
+    (LOCK_SH для чтения, LOCK_EX для записи), внутри процесса писатели
+    дополнительно сериализуются threading.Lock.
+    Каждый захват открывает свой дескриптор, поэтому flock разделяет
+    и потоки одного процесса.
+    Писатель может удержать блокировку между процессами после выхода из write()
+    (hold/release) - так групповая запись не дает другим процессам
+    изменить файл до физической записи накопленных изменений
+    '''
+    
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self._write_lock = threading.Lock()
+        self._held_fd = None
+        self._keep = False
+    
+    @contextmanager
+    def _flock(self, operation: int):
+        if fcntl is None:
+            yield
+            return
+        
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            # Закрытие дескриптора снимает блокировку
+            os.close(fd)
+    
+    @contextmanager
+    def read(self):
+        '''
+        Разделяемая блокировка: читатели не ждут друг друга
+        '''
+        if self._held_fd is not None:
+            # Процесс сам удерживает исключительную блокировку
+            yield
+            return
+        with self._flock(fcntl.LOCK_SH if fcntl else 0):
+            yield
+    
+    @contextmanager
+    def write(self):
+        '''
+        Исключительная блокировка для чтения-изменения-записи
+        '''
+        with self._write_lock:
+            if self._held_fd is not None or fcntl is None:
+                yield
+                return
+            
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                if self._keep:
+                    self._held_fd = fd
+                    self._keep = False
+                else:
+                    os.close(fd)
+    
+    def hold(self):
+        '''
+        Не снимать блокировку между процессами при выходе из текущего write()
+        (вызывается внутри write(), снимается через release())
+        '''
+        if fcntl is not None and self._held_fd is None:
+            self._keep = True
+    
+    def release(self):
+        '''
+        Снятие удержанной блокировки (вызывается внутри write())
+        '''
+        self._keep = False
+        if self._held_fd is not None:
+            os.close(self._held_fd)
+            self._held_fd = None
+
+
+# Набор блокировок по именам сущностей
+class LockRegistry:
+    '''
+    Выдает по одной EntityLock на сущность
+    '''
+    
+    def __init__(self, lock_dir: str):
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+        self._locks = {}
+        self._guard = threading.Lock()
+    
+    def get(self, name: str) -> EntityLock:
+        lock = self._locks.get(name)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.get(name)
+                if lock is None:
+                    # Вложенные сущности (portfolios/bucket_001) - плоское имя файла
+                    filename = name.replace('/', '.')
+                    lock = EntityLock(os.path.join(self.lock_dir, f'{filename}.lock'))
+                    self._locks[name] = lock
+        return lock
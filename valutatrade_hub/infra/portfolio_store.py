@@ -0,0 +1,71 @@
+# valutatrade_hub/infra/portfolio_store.py
+import os
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from .database import db
+from .settings import settings
+
+
+# Хранилище портфелей через DatabaseManager (режим по умолчанию)
+class DatabasePortfolioStore:
+    '''
+    Хранение портфелей в сущности portfolios текущего бэкенда DatabaseManager
+    '''
+    
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        '''
+        Получение кошельков пользователя (None если портфеля нет)
+        '''
+        portfolio_data = db.find_one('portfolios', 'user_id', user_id)
+        if not portfolio_data:
+            return None
+        return portfolio_data['wallets']
+    
+    def put(self, user_id: int, wallets: Dict[str, Any]):
+        '''
+        Сохранение кошельков пользователя (создает портфель если его нет)
+        '''
+        db.upsert('portfolios', 'user_id', {
+            'user_id': user_id,
+            'wallets': wallets
+        })
+
+
+_store = None
+_store_lock = Lock()
+
+
+def _is_sharded() -> bool:
+    '''
+    Портфели уже перенесены в бакеты (есть манифест data/portfolios/)
+    '''
+    from .shards import MANIFEST_FILE
+    return os.path.exists(os.path.join(db.data_dir, 'portfolios', MANIFEST_FILE))
+
+
+def get_portfolio_store():
+    '''
+    Получение хранилища портфелей согласно настройке portfolio_storage
+    '''
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                mode = settings.get('portfolio_storage', 'json')
+                if mode in ('json', 'journal') and db._backend is None and _is_sharded():
+                    raise ValueError(
+                        f'Ошибка: Портфели разбиты на бакеты (data/portfolios/), режим "{mode}" их не видит - '
+                        'используйте portfolio_storage = sharded'
+                    )
+                if mode == 'journal':
+                    from .journal import JournaledPortfolioStore
+                    _store = JournaledPortfolioStore()
+                elif mode == 'sharded':
+                    from .shards import ShardedPortfolioStore
+                    _store = ShardedPortfolioStore()
+                elif mode == 'json':
+                    _store = DatabasePortfolioStore()
+                else:
+                    raise ValueError(f'Ошибка: Неизвестный режим хранения портфелей "{mode}"')
+    return _store
@@ -27,7 +27,19 @@ class SettingsLoader:
             'log_level': 'INFO',
             'log_file': 'logs/valutatrade.log',
             'supported_currencies': ['USD', 'EUR', 'GBP', 'RUB', 'BTC', 'ETH', 'SOL'],
-            'api_timeout': 10
+            'api_timeout': 10,
+            # Бэкенд хранения: json (файлы в data_directory) или sqlite
+            'storage_backend': 'json',
+            'sqlite_path': None,
+            # Окно групповой записи update_data в мс (0 - запись сразу)
+            'group_commit_ms': 0,
+            # Хранение портфелей: json (весь portfolios.json), journal (журнал + снапшот)
+            # или sharded (бакеты data/portfolios/bucket_NNN.json)
+            'portfolio_storage': 'json',
+            'portfolio_shards': 16,
+            'journal_compact_threshold': 1000,
+            'journal_compact_interval_seconds': 60,
+            'journal_fsync': True
         }
         
         self._settings.update(default_settings)
@@ -42,12 +54,16 @@ class SettingsLoader:
             'VALUTATRADE_DATA_DIR': 'data_directory',
             'VALUTATRADE_RATES_TTL': 'rates_ttl_seconds',
             'VALUTATRADE_LOG_LEVEL': 'log_level',
+            'VALUTATRADE_PORTFOLIO_STORAGE': 'portfolio_storage',
+            'VALUTATRADE_STORAGE_BACKEND': 'storage_backend',
+            'VALUTATRADE_SQLITE_PATH': 'sqlite_path',
+            'VALUTATRADE_GROUP_COMMIT_MS': 'group_commit_ms',
         }
         
         for env_var, setting_key in env_mapping.items():
             value = os.getenv(env_var)
             if value:
-                if setting_key == 'rates_ttl_seconds':
+                if setting_key in ('rates_ttl_seconds', 'group_commit_ms'):
                     self._settings[setting_key] = int(value)
                 else:
                     self._settings[setting_key] = value
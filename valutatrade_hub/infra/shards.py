@@ -0,0 +1,137 @@
+# valutatrade_hub/infra/shards.py
+import os
+import shutil
+from typing import Any, Dict, Optional
+
+from ..logging_config import get_logger
+from .database import db
+from .settings import settings
+
+# Манифест каталога бакетов: число бакетов, с которым разбиты портфели
+MANIFEST_FILE = 'manifest.json'
+# Суффикс архивной копии portfolios.json после разбиения на бакеты
+MIGRATED_SUFFIX = '.migrated'
+
+
+# Хранилище портфелей, разбитое на файлы-бакеты по user_id
+class ShardedPortfolioStore:
+    '''
+    Портфели лежат в data/portfolios/bucket_NNN.json (user_id % portfolio_shards)
+    или по файлу на пользователя (portfolio_shards = 0).
+    Каждый бакет - отдельная сущность DatabaseManager со своим кешем,
+    индексом и блокировкой, поэтому сделка читает и переписывает
+    только один небольшой файл, а сделки разных бакетов не ждут друг друга
+    '''
+    
+    def __init__(self):
+        if db._backend is not None:
+            raise ValueError('Ошибка: Шардирование портфелей доступно только для JSON-хранилища')
+        
+        self.logger = get_logger('shards')
+        self.shards = settings.get('portfolio_shards', 16)
+        self.shard_dir = os.path.join(db.data_dir, 'portfolios')
+        self._migrate()
+    
+    def _entity(self, user_id: int) -> str:
+        '''
+        Имя сущности бакета для пользователя
+        '''
+        if self.shards <= 0:
+            return f'portfolios/user_{user_id}'
+        return f'portfolios/bucket_{user_id % self.shards:03d}'
+    
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        '''
+        Получение кошельков пользователя (None если портфеля нет)
+        '''
+        portfolio_data = db.find_one(self._entity(user_id), 'user_id', user_id)
+        if not portfolio_data:
+            return None
+        return portfolio_data['wallets']
+    
+    def put(self, user_id: int, wallets: Dict[str, Any]):
+        '''
+        Сохранение кошельков пользователя в его бакет
+        '''
+        db.upsert(self._entity(user_id), 'user_id', {
+            'user_id': user_id,
+            'wallets': wallets
+        })
+    
+    def _migrate(self):
+        '''
+        Разбиение портфелей на бакеты при первом запуске и при смене portfolio_shards.
+        Число бакетов записано в манифесте data/portfolios/manifest.json: при расхождении
+        с настройкой (или без манифеста) все записи перераспределяются заново.
+        Бакеты пишутся во временный каталог, который затем атомарно
+        переименовывается - наличие data/portfolios с манифестом означает завершенный перенос.
+        После первого разбиения portfolios.json переименовывается в portfolios.json.migrated
+        '''
+        if self._manifest_shards() == self.shards:
+            return
+        
+        with db._locks.get('portfolios').write():
+            old_dir = self.shard_dir + '.old'
+            if not os.path.isdir(self.shard_dir) and os.path.isdir(old_dir):
+                # Прерванная замена каталога: старые бакеты еще целы
+                os.rename(old_dir, self.shard_dir)
+            
+            current = self._manifest_shards()
+            if current == self.shards:
+                return
+            
+            if os.path.isdir(self.shard_dir):
+                records = self._read_shards()
+                self.logger.info(f'Resharding portfolios: {current} -> {self.shards} shards')
+            else:
+                records = db._read_entity('portfolios') or []
+            
+            buckets: Dict[str, list] = {}
+            for portfolio_data in records:
+                entity = self._entity(portfolio_data['user_id'])
+                buckets.setdefault(entity, []).append(portfolio_data)
+            
+            tmp_dir = self.shard_dir + '.migrating'
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            for entity, bucket_records in buckets.items():
+                filename = os.path.basename(entity) + '.json'
+                db._write_file(os.path.join(tmp_dir, filename), bucket_records)
+            db._write_file(os.path.join(tmp_dir, MANIFEST_FILE), {'shards': self.shards})
+            
+            if os.path.isdir(self.shard_dir):
+                shutil.rmtree(old_dir, ignore_errors=True)
+                os.rename(self.shard_dir, old_dir)
+                os.rename(tmp_dir, self.shard_dir)
+                shutil.rmtree(old_dir, ignore_errors=True)
+                # Кеш мог хранить бакеты прежнего разбиения
+                db.invalidate()
+            else:
+                os.rename(tmp_dir, self.shard_dir)
+                # Исходный файл больше не источник данных: архивируется, чтобы режим json
+                # не отдал устаревшие балансы
+                legacy_path = db._get_filepath('portfolios')
+                if os.path.exists(legacy_path):
+                    os.replace(legacy_path, legacy_path + MIGRATED_SUFFIX)
+                    db.invalidate('portfolios')
+            self.logger.info(f'Split portfolios into {len(buckets)} shard files')
+    
+    def _manifest_shards(self) -> Optional[int]:
+        '''
+        Число бакетов, с которым разбиты портфели на диске (None если манифеста нет)
+        '''
+        manifest = db._read_file(os.path.join(self.shard_dir, MANIFEST_FILE))
+        if not isinstance(manifest, dict):
+            return None
+        return manifest.get('shards')
+    
+    def _read_shards(self) -> list:
+        '''
+        Все портфели из файлов бакетов на диске (независимо от их числа)
+        '''
+        records = []
+        for filename in sorted(os.listdir(self.shard_dir)):
+            if filename == MANIFEST_FILE or filename.startswith('.') or not filename.endswith('.json'):
+                continue
+            records.extend(db._read_file(os.path.join(self.shard_dir, filename)) or [])
+        return records
@@ -0,0 +1,313 @@
+# valutatrade_hub/infra/sqlite_backend.py
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Списочные сущности с индексируемыми колонками: entity -> (первичный ключ, доп. колонки)
+RECORD_TABLES = {
+    'users': ('user_id', ('username',)),
+    'portfolios': ('user_id', ()),
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS portfolios (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exchange_rates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pair TEXT,
+    from_currency TEXT,
+    to_currency TEXT,
+    timestamp TEXT,
+    data TEXT NOT NULL
+);
+DROP INDEX IF EXISTS idx_exchange_rates_pair;
+DROP TABLE IF EXISTS rate_pairs;
+CREATE TABLE IF NOT EXISTS documents (
+    entity TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+'''
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+# Хранилище на SQLite с той же семантикой load_data/save_data/update_data
+class SqliteBackend:
+    '''
+    Бэкенд DatabaseManager на stdlib sqlite3 (WAL).
+    users и portfolios хранятся построчно с индексами по user_id/username,
+    история курсов - построчно с индексом по валютной паре,
+    остальные сущности (rates и т.д.) - JSON-документом
+    '''
+    
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+    
+    def _connection(self) -> sqlite3.Connection:
+        '''
+        Отдельное соединение на каждый поток
+        '''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def load_data(self, entity: str) -> Any:
+        '''
+        Загрузка сущности в том же виде, что и из JSON-файла
+        '''
+        conn = self._connection()
+        if entity in RECORD_TABLES:
+            key = RECORD_TABLES[entity][0]
+            rows = conn.execute(f'SELECT data FROM {entity} ORDER BY {key}').fetchall()
+            return [json.loads(row[0]) for row in rows]
+        
+        if entity == 'exchange_rates':
+            rows = conn.execute('SELECT data FROM exchange_rates ORDER BY id').fetchall()
+            return [json.loads(row[0]) for row in rows]
+        
+        row = conn.execute('SELECT data FROM documents WHERE entity = ?', (entity,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def save_data(self, entity: str, data: Any):
+        '''
+        Полная замена данных сущности
+        '''
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._save(conn, entity, data)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def update_data(self, entity: str, update_fn: callable) -> Any:
+        '''
+        Чтение-изменение-запись в одной транзакции
+        '''
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            updated_data = update_fn(self.load_data(entity))
+            self._save(conn, entity, updated_data)
+            conn.execute('COMMIT')
+            return updated_data
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def find_one(self, entity: str, field: str, value: Any) -> Optional[Dict]:
+        '''
+        Поиск записи по индексируемому полю
+        '''
+        if entity not in RECORD_TABLES or field not in self._indexed_fields(entity):
+            records = self.load_data(entity) or []
+            return next((r for r in records if r.get(field) == value), None)
+        
+        row = self._connection().execute(f'SELECT data FROM {entity} WHERE {field} = ?', (value,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def upsert(self, entity: str, field: str, record: Dict):
+        '''
+        Вставка или замена одной записи по первичному ключу
+        '''
+        if entity not in RECORD_TABLES or field != RECORD_TABLES[entity][0]:
+            raise ValueError(f'Ошибка: upsert для {entity}.{field} не поддерживается')
+        
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._insert_records(conn, entity, [record], replace=True)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def insert(self, entity: str, field: str, make_record: Callable[[int], Dict],
+               unique: Optional[Tuple[str, Any]] = None) -> Optional[Dict]:
+        '''
+        Вставка одной записи с новым первичным ключом после проверки уникального поля
+        (в одной транзакции); None если запись с таким значением unique уже есть
+        '''
+        if entity not in RECORD_TABLES or field != RECORD_TABLES[entity][0]:
+            raise ValueError(f'Ошибка: insert для {entity}.{field} не поддерживается')
+        if unique is not None and unique[0] not in self._indexed_fields(entity):
+            raise ValueError(f'Ошибка: Поле {entity}.{unique[0]} не индексируется')
+        
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if unique is not None and conn.execute(
+                f'SELECT 1 FROM {entity} WHERE {unique[0]} = ?', (unique[1],)
+            ).fetchone():
+                conn.execute('ROLLBACK')
+                return None
+            row = conn.execute(f'SELECT COALESCE(MAX({field}), 0) FROM {entity}').fetchone()
+            record = make_record(row[0] + 1)
+            self._insert_records(conn, entity, [record])
+            conn.execute('COMMIT')
+            return record
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def append(self, entity: str, records: List[Dict], max_records: Optional[int] = None, since: Optional[str] = None):
+        '''
+        Дозапись истории курсов построчными INSERT с обрезкой по времени и числу записей
+        '''
+        if entity != 'exchange_rates':
+            raise ValueError(f'Ошибка: append для {entity} не поддерживается')
+        
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO exchange_rates (pair, from_currency, to_currency, timestamp, data) VALUES (?, ?, ?, ?, ?)',
+                [self._history_row(record) for record in records]
+            )
+            if since is not None:
+                conn.execute('DELETE FROM exchange_rates WHERE timestamp IS NULL OR timestamp < ?', (since,))
+            if max_records is not None:
+                conn.execute(
+                    'DELETE FROM exchange_rates WHERE id <= (SELECT id FROM exchange_rates ORDER BY id DESC LIMIT 1 OFFSET ?)',
+                    (max_records,)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def _indexed_fields(self, entity: str):
+        key, columns = RECORD_TABLES[entity]
+        return (key,) + columns
+    
+    def _save(self, conn: sqlite3.Connection, entity: str, data: Any):
+        if entity in RECORD_TABLES:
+            conn.execute(f'DELETE FROM {entity}')
+            self._insert_records(conn, entity, data or [])
+        elif entity == 'exchange_rates':
+            conn.execute('DELETE FROM exchange_rates')
+            conn.executemany(
+                'INSERT INTO exchange_rates (pair, from_currency, to_currency, timestamp, data) VALUES (?, ?, ?, ?, ?)',
+                [self._history_row(record) for record in data or []]
+            )
+        else:
+            conn.execute('INSERT OR REPLACE INTO documents (entity, data) VALUES (?, ?)', (entity, _dumps(data)))
+    
+    def _insert_records(self, conn: sqlite3.Connection, entity: str, records: List[Dict], replace: bool = False):
+        fields = self._indexed_fields(entity)
+        columns = ', '.join(fields + ('data',))
+        placeholders = ', '.join('?' for _ in range(len(fields) + 1))
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+        conn.executemany(
+            f'{verb} INTO {entity} ({columns}) VALUES ({placeholders})',
+            [tuple(record[field] for field in fields) + (_dumps(record),) for record in records]
+        )
+    
+    def _history_row(self, record: Dict) -> tuple:
+        from_currency = record.get('from_currency')
+        to_currency = record.get('to_currency')
+        pair = f'{from_currency}_{to_currency}' if from_currency and to_currency else None
+        return pair, from_currency, to_currency, record.get('timestamp'), _dumps(record)
+    
+
+# Сущности JSON-хранилища, переносимые в SQLite (служебные файлы - кеши и индексы - не переносятся)
+MIGRATED_ENTITIES = ('users', 'portfolios', 'rates', 'exchange_rates')
+
+
+# Одноразовый перенос JSON-хранилища в SQLite
+def migrate_json_to_sqlite(data_dir: str, db_path: str) -> Dict[str, int]:
+    '''
+    Импорт users/portfolios/rates/exchange_rates в базу SQLite,
+    возвращает число импортированных записей по сущностям.
+    Портфели собираются с учетом режима хранения: бакеты data/portfolios/
+    (если есть манифест) или portfolios.json, поверх - несвернутый журнал
+    '''
+    backend = SqliteBackend(db_path)
+    imported = {}
+    
+    for entity in MIGRATED_ENTITIES:
+        if entity == 'portfolios':
+            data = _read_portfolios(data_dir)
+        else:
+            data = _read_json(os.path.join(data_dir, f'{entity}.json'))
+        if data is None:
+            continue
+        
+        backend.save_data(entity, data)
+        imported[entity] = len(data) if isinstance(data, list) else 1
+        print(f'Импортировано {entity}: {imported[entity]}')
+    
+    return imported
+
+
+def _read_json(path: str) -> Any:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f'Пропуск {path}: {e}')
+        return None
+
+
+def _read_portfolios(data_dir: str) -> Optional[List[Dict]]:
+    '''
+    Актуальные портфели: снапшот (бакеты или portfolios.json) + журнал сделок
+    '''
+    shard_dir = os.path.join(data_dir, 'portfolios')
+    if os.path.exists(os.path.join(shard_dir, 'manifest.json')):
+        records = []
+        for filename in sorted(os.listdir(shard_dir)):
+            if filename.endswith('.json') and filename != 'manifest.json' and not filename.startswith('.'):
+                records.extend(_read_json(os.path.join(shard_dir, filename)) or [])
+    else:
+        records = _read_json(os.path.join(data_dir, 'portfolios.json'))
+    
+    state = {record['user_id']: record['wallets'] for record in records or []}
+    journal_path = os.path.join(data_dir, 'portfolios.journal')
+    replayed = 0
+    for path in (journal_path + '.compacting', journal_path):
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя строка после сбоя
+                    continue
+                state[record['user_id']] = record['wallets']
+                replayed += 1
+    if replayed:
+        print(f'Применено записей журнала портфелей: {replayed}')
+    
+    if records is None and not replayed:
+        return None
+    return [{'user_id': user_id, 'wallets': wallets} for user_id, wallets in sorted(state.items())]
+
+
+if __name__ == '__main__':
+    from .settings import settings
+    
+    data_directory = settings.get('data_directory', 'data')
+    migrate_json_to_sqlite(data_directory, settings.get('sqlite_path') or os.path.join(data_directory, 'valutatrade.db'))
@@ -1,8 +1,17 @@
 # valutatrade_hub/parser_service/api_clients.py
+import asyncio
+import random
+import threading
 import time
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from .circuit_breaker import CircuitBreaker
+from .http_cache import get_response_cache
+from .rate_limit import TokenBucket
 
 
 # Временный класс исключения, так как оригинальный может быть недоступен
@@ -10,56 +19,236 @@ class ApiRequestError(Exception):
     pass
 
 
+class CircuitOpenError(ApiRequestError):
+    '''
+    Источник отключен автоматом после серии неудачных запросов
+    '''
+    pass
+
+
+class RateLimitedError(ApiRequestError):
+    '''
+    Превышен лимит частоты запросов к источнику
+    '''
+    pass
+
+
 # Основной класс для API клиентов
 class BaseApiClient:
     '''
     config - текущий конфиг.
-    Базовый класс для API клиентов
+    Базовый класс для API клиентов.
+    Ответы кешируются (ResponseCache): свежий ответ берется из кеша без запроса,
+    устаревший перепроверяется условным запросом (ETag / Last-Modified).
+    data_unchanged - последний ответ совпадает с уже полученным ранее.
+    breaker - автомат отключения источника после серии неудач.
+    limiter - корзина токенов, общая для всех экземпляров подкласса
+    (source_name - ключ лимита в config.RATE_LIMITS)
     '''
     
+    source_name: str = ''
+    
+    # Ограничители частоты по подклассам: один лимит на провайдера на весь процесс
+    _limiters: Dict[type, TokenBucket] = {}
+    _limiters_lock = threading.Lock()
+    
     def __init__(self, config):
         self.config = config
+        self.cache = get_response_cache(config.HTTP_CACHE_FILE_PATH)
+        self.data_unchanged = False
+        self.breaker = CircuitBreaker(config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RECOVERY_SECONDS)
+        self.limiter = self._get_limiter(config)
         self.session = requests.Session()
+        # Пул соединений на параллельные запросы частями (keep-alive между циклами)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, config.FETCH_WORKERS, config.MAX_IN_FLIGHT_REQUESTS))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
             'User-Agent': 'CurrencyParser/1.0',
             'Accept': 'application/json'
         })
     
+    @classmethod
+    def _get_limiter(cls, config) -> Optional[TokenBucket]:
+        limit = config.RATE_LIMITS.get(cls.source_name)
+        if limit is None:
+            return None
+        with cls._limiters_lock:
+            if cls not in cls._limiters:
+                cls._limiters[cls] = TokenBucket(*limit)
+            return cls._limiters[cls]
+    
+    def rate_limit_wait(self) -> float:
+        '''
+        Секунд до возможности выполнить сетевой запрос (0 если запрос не нужен или разрешен)
+        '''
+        if self.limiter is None or self.breaker.is_blocked():
+            return 0.0
+        # Нужен токен на каждый устаревший запрос (не больше, чем вмещает корзина -
+        # остальные части выдаются по мере пополнения)
+        stale = self._stale_count(self._request_targets())
+        if not stale:
+            return 0.0
+        return self.limiter.wait_time(min(stale, self.limiter.capacity))
+    
+    def _stale_count(self, targets: List[Tuple[str, Optional[Dict]]]) -> int:
+        '''
+        Число запросов, которым нужен сетевой вызов (ответ в кеше отсутствует или устарел)
+        '''
+        stale = 0
+        for url, params in targets:
+            entry = self.cache.get(self.cache.make_key(url, params))
+            if entry is None or not self.cache.is_fresh(entry):
+                stale += 1
+        return stale
+    
+    def _pacing_wait(self, targets: List[Tuple[str, Optional[Dict]]]) -> Optional[float]:
+        '''
+        Допустимое ожидание токена для запросов одного обновления:
+        части большого списка выдаются через корзину по очереди, а не отбрасываются
+        после RATE_LIMIT_MAX_WAIT_SECONDS (но не дольше дедлайна обновления)
+        '''
+        if self.limiter is None:
+            return None
+        needed = self.limiter.wait_time(self._stale_count(targets))
+        return min(self.config.UPDATE_DEADLINE_SECONDS, max(self.config.RATE_LIMIT_MAX_WAIT_SECONDS, needed))
+    
+    def _request_targets(self) -> List[Tuple[str, Optional[Dict]]]:
+        '''
+        URL и параметры запросов клиента за одно обновление
+        '''
+        raise NotImplementedError
+    
     def fetch_rates(self) -> Dict[str, float]:
         '''
         Получение курсов валют - должен быть реализован в подклассах
         '''
         raise NotImplementedError
     
+    async def afetch_rates(self, pool) -> Dict[str, float]:
+        '''
+        Асинхронное получение курсов через общий AsyncRequestPool
+        (по умолчанию - синхронный fetch_rates одним запросом пула)
+        '''
+        try:
+            return await pool.run(self.fetch_rates)
+        except asyncio.TimeoutError:
+            raise ApiRequestError(f'Ошибка: Таймаут запроса {pool.timeout} с')
+    
     def _make_request(self, url: str, params: Optional[Dict] = None) -> Dict:
         '''
-        Выполнение HTTP запроса с повторными попытками
+        Выполнение HTTP запроса с кешированием ответа и автоматом отключения источника
+        '''
+        data, self.data_unchanged = self._fetch(url, params)
+        return data
+    
+    def _fetch(self, url: str, params: Optional[Dict] = None, max_wait: Optional[float] = None) -> Tuple[Dict, bool]:
+        '''
+        Ответ и признак того, что он не изменился с прошлого раза
+        (без изменения состояния клиента - можно вызывать из нескольких потоков).
+        max_wait - ожидание токена лимита (по умолчанию RATE_LIMIT_MAX_WAIT_SECONDS)
         '''
+        key = self.cache.make_key(url, params)
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            return entry['body'], True
+        
+        # Автомат проверяется до лимита: отключенный источник не ждет и не тратит токены
+        if self.breaker.is_blocked():
+            raise self._circuit_open_error()
+        
+        if max_wait is None:
+            max_wait = self.config.RATE_LIMIT_MAX_WAIT_SECONDS
+        if self.limiter is not None and not self.limiter.acquire(max_wait):
+            if entry is not None:
+                # Лимит исчерпан - повторный запрос объединяется с последним полученным ответом
+                return entry['body'], True
+            raise RateLimitedError(
+                f'Ошибка: Превышен лимит запросов, повтор через {self.limiter.wait_time():.0f} с'
+            )
+        
+        # Пробный запрос полуоткрытого автомата занимается только с токеном на руках
+        if not self.breaker.allow_request():
+            raise self._circuit_open_error()
+        
+        try:
+            result = self._request_with_retries(url, params, key, entry)
+        except RateLimitedError:
+            # Ограничение частоты - не признак недоступности источника
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        return result
+    
+    def _circuit_open_error(self) -> CircuitOpenError:
+        return CircuitOpenError(
+            f'Ошибка: Источник временно отключен после серии ошибок, '
+            f'повтор через {self.breaker.retry_in():.0f} с'
+        )
+    
+    def _request_with_retries(self, url: str, params: Optional[Dict], key: str, entry: Optional[Dict]) -> Tuple[Dict, bool]:
+        '''
+        Запрос с экспоненциальной задержкой между попытками и случайным разбросом.
+        Пробный запрос полуоткрытого автомата выполняется один раз
+        '''
+        retries = 1 if self.breaker.is_probing() else self.config.REQUEST_RETRIES
         last_error = None
         
-        for attempt in range(self.config.REQUEST_RETRIES):
+        for attempt in range(retries):
+            if attempt > 0 and self.limiter is not None and not self.limiter.acquire(self.config.RATE_LIMIT_MAX_WAIT_SECONDS):
+                raise RateLimitedError(f'Ошибка: Превышен лимит запросов после {attempt} попыток: {last_error}')
             try:
-                self.config.validate()
                 response = self.session.get(
                     url, 
                     params=params, 
+                    headers=self.cache.conditional_headers(entry),
                     timeout=self.config.REQUEST_TIMEOUT
                 )
                 
+                if response.status_code == 304 and entry is not None:
+                    return self.cache.revalidate(key, response.headers)['body'], True
+                
+                if response.status_code == 429:
+                    retry_after = self._retry_after(response.headers)
+                    if self.limiter is not None:
+                        self.limiter.block_for(retry_after)
+                    raise RateLimitedError(f'Ошибка: HTTP 429, повтор через {retry_after:.0f} с')
+                
                 if response.status_code != 200:
                     raise ApiRequestError(f'HTTP {response.status_code}: {response.text}')
                 
                 data = response.json()
-                return data
+                self.cache.store(key, response.headers, data)
+                return data, entry is not None and entry.get('body') == data
                 
             except requests.exceptions.RequestException as e:
                 last_error = e
-                if attempt == self.config.REQUEST_RETRIES - 1:
-                    raise ApiRequestError(f'Не удалось выполнить запрос после {self.config.REQUEST_RETRIES} попыток: {last_error}')
+                if attempt == retries - 1:
+                    raise ApiRequestError(f'Не удалось выполнить запрос после {retries} попыток: {last_error}')
                 
-                time.sleep(self.config.RETRY_DELAY * (attempt + 1))
+                time.sleep(self._backoff_delay(attempt))
         
         raise ApiRequestError(f'Ошибка: Все попытки завершились ошибкой: {last_error}')
+    
+    def _retry_after(self, headers) -> float:
+        '''
+        Пауза из заголовка Retry-After (секунды), иначе интервал пополнения одного токена
+        '''
+        try:
+            return max(0.0, float(headers.get('Retry-After')))
+        except (TypeError, ValueError):
+            return 1 / self.limiter.rate if self.limiter is not None and self.limiter.rate > 0 else self.config.RETRY_MAX_DELAY
+    
+    def _backoff_delay(self, attempt: int) -> float:
+        '''
+        Задержка перед повтором: RETRY_DELAY * 2^attempt (не больше RETRY_MAX_DELAY)
+        со случайным разбросом по всему интервалу, чтобы повторы клиентов не совпадали
+        '''
+        ceiling = min(self.config.RETRY_MAX_DELAY, self.config.RETRY_DELAY * (2 ** attempt))
+        return random.uniform(0, ceiling)
 
 
 # Класс для работы с CoinGecko API (наследуется от BaseApiClient)
@@ -68,26 +257,84 @@ class CoinGeckoClient(BaseApiClient):
     Клиент для работы с CoinGecko API (без ключа)
     '''
     
+    source_name = 'coingecko'
+    
+    def _request_targets(self) -> List[Tuple[str, Optional[Dict]]]:
+        return [(self.config.COINGECKO_URL, params) for params in self.config.get_coingecko_param_chunks()]
+    
     def fetch_rates(self) -> Dict[str, float]:
         '''
-        Получение курсов криптовалют
+        Получение курсов криптовалют.
+        Большой список монет запрашивается частями параллельно; ошибка одной части
+        не отменяет остальные, исключение - только если не удалась ни одна
+        '''
+        targets = self._request_targets()
+        max_wait = self._pacing_wait(targets)
+        if len(targets) == 1:
+            results = [self._fetch_chunk(*targets[0], max_wait)]
+        else:
+            with ThreadPoolExecutor(
+                max_workers=min(len(targets), self.config.FETCH_WORKERS),
+                thread_name_prefix='coingecko-chunk'
+            ) as executor:
+                results = list(executor.map(lambda target: self._fetch_chunk(*target, max_wait), targets))
+        return self._collect(results)
+    
+    async def afetch_rates(self, pool) -> Dict[str, float]:
         '''
+        Асинхронный вариант: все части - отдельные запросы общего пула
+        '''
+        targets = self._request_targets()
+        max_wait = self._pacing_wait(targets)
+        
+        async def fetch(url: str, params: Dict):
+            # Ожидание токена входит в таймаут запроса пула
+            timeout = pool.timeout + (max_wait or 0)
+            try:
+                return await pool.run(self._fetch_chunk, url, params, max_wait, timeout=timeout)
+            except asyncio.TimeoutError:
+                return {}, False, ApiRequestError(f'Ошибка: Таймаут запроса {timeout:.0f} с')
+        
+        results = await asyncio.gather(*(fetch(url, params) for url, params in targets))
+        return self._collect(results)
+    
+    def _collect(self, results: List[Tuple[Dict, bool, Optional[Exception]]]) -> Dict[str, float]:
+        '''
+        Объединение ответов частей в один снимок курсов
+        '''
+        data = {}
+        unchanged = True
+        errors = []
+        for chunk_data, chunk_unchanged, error in results:
+            if error is not None:
+                errors.append(error)
+                continue
+            data.update(chunk_data)
+            unchanged = unchanged and chunk_unchanged
+        
+        if len(errors) == len(results):
+            print(f'CoinGecko error: {errors[0]}')
+            raise ApiRequestError(f'Ошибка: Ошибка получения данных от CoinGecko: {errors[0]}')
+        if errors:
+            print(f'CoinGecko: не получено {len(errors)} из {len(results)} частей: {errors[0]}')
+        self.data_unchanged = unchanged
+        
+        rates = {}
+        base = self.config.BASE_CURRENCY.lower()
+        for crypto_code, gecko_id in self.config.CRYPTO_ID_MAP.items():
+            if gecko_id in data and base in data[gecko_id]:
+                pair_key = f"{crypto_code}_{self.config.BASE_CURRENCY}"
+                rates[pair_key] = data[gecko_id][base]
+        
+        print(f'CoinGecko: получено {len(rates)} крипто-курсов')
+        return rates
+    
+    def _fetch_chunk(self, url: str, params: Dict, max_wait: Optional[float] = None) -> Tuple[Dict, bool, Optional[Exception]]:
         try:
-            params = self.config.get_coingecko_params()
-            data = self._make_request(self.config.COINGECKO_URL, params)
-            
-            rates = {}
-            for crypto_code, gecko_id in self.config.CRYPTO_ID_MAP.items():
-                if gecko_id in data and self.config.BASE_CURRENCY.lower() in data[gecko_id]:
-                    pair_key = f"{crypto_code}_{self.config.BASE_CURRENCY}"
-                    rates[pair_key] = data[gecko_id][self.config.BASE_CURRENCY.lower()]
-            
-            print(f'CoinGecko: получено {len(rates)} крипто-курсов')
-            return rates
-            
+            data, unchanged = self._fetch(url, params, max_wait)
+            return data, unchanged, None
         except Exception as e:
-            print(f'CoinGecko error: {e}')
-            raise ApiRequestError(f'Ошибка: Ошибка получения данных от CoinGecko: {e}')
+            return {}, False, e
 
 
 # Класс для работы с xchangeRate API (наследуется от BaseApiClient)
@@ -96,13 +343,18 @@ class ExchangeRateApiClient(BaseApiClient):
     Клиент для работы с ExchangeRate-API (требует ключ)
     '''
     
+    source_name = 'exchangerate'
+    
+    def _request_targets(self) -> List[Tuple[str, Optional[Dict]]]:
+        return [(self.config.get_exchangerate_url(), None)]
+    
     def fetch_rates(self) -> Dict[str, float]:
         '''
         Получение курсов фиатных валют
         '''
         try:
-            url = self.config.get_exchangerate_url()
-            data = self._make_request(url)
+            url, params = self._request_targets()[0]
+            data = self._make_request(url, params)
             
             if data.get('result') != 'success':
                 error_type = data.get('error-type', 'unknown_error')
@@ -0,0 +1,79 @@
+# valutatrade_hub/parser_service/async_engine.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+# Общий ограниченный пул для сетевых запросов из цикла событий
+class AsyncRequestPool:
+    '''
+    Выполнение блокирующих запросов (requests) из asyncio:
+    не более max_in_flight одновременно, у каждого - свой таймаут.
+    Потоки пула переиспользуются, а соединения - через HTTPAdapter сессий клиентов
+    '''
+    
+    def __init__(self, max_in_flight: int, timeout: float):
+        self.max_in_flight = max(1, max_in_flight)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='rates-io')
+        self._semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+    
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Семафор привязан к циклу событий, а синхронная обертка создает новый цикл на каждый вызов
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            self._semaphores = {loop: asyncio.Semaphore(self.max_in_flight)}
+            semaphore = self._semaphores[loop]
+        return semaphore
+    
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        '''
+        Выполнение fn(*args) в пуле с таймаутом (asyncio.TimeoutError по истечении)
+        '''
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, fn, *args),
+                timeout=self.timeout if timeout is None else timeout
+            )
+    
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Асинхронный опрос источников курсов
+class AsyncIngestionEngine:
+    '''
+    Параллельный опрос клиентов (и частей их запросов) из одного цикла событий
+    через общий AsyncRequestPool с общим дедлайном на обновление
+    '''
+    
+    def __init__(self, clients: Dict[str, Any], pool: AsyncRequestPool):
+        self.clients = clients
+        self.pool = pool
+    
+    async def fetch_all(self, sources: Iterable[str], deadline: float) -> Dict[str, Any]:
+        '''
+        Результаты по источникам: словарь курсов или исключение.
+        Источники, не уложившиеся в deadline, получают asyncio.TimeoutError
+        '''
+        tasks = {
+            source: asyncio.create_task(self.clients[source].afetch_rates(self.pool), name=f'fetch-{source}')
+            for source in sources
+        }
+        if not tasks:
+            return {}
+        
+        await asyncio.wait(tasks.values(), timeout=deadline)
+        
+        results = {}
+        for source, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                results[source] = asyncio.TimeoutError(f'deadline {deadline}s exceeded')
+            elif task.exception() is not None:
+                results[source] = task.exception()
+            else:
+                results[source] = task.result()
+        return results
@@ -0,0 +1,229 @@
+# valutatrade_hub/parser_service/candles.py
+import atexit
+import json
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Разрешения свечей: имя -> длительность бара в секундах
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# Поля бара в компактной записи
+START, OPEN, HIGH, LOW, CLOSE, COUNT, LAST = range(7)
+
+FILE_SUFFIX = '.jsonl'
+
+
+# Агрегатор OHLC-свечей по парам
+class CandleAggregator:
+    '''
+    Свечи open/high/low/close/count по каждой паре на разрешениях 1m, 1h и 1d.
+    Каждый новый снимок курсов обновляет текущие бары инкрементально,
+    хранится не более max_bars последних баров на разрешение.
+    На диске - по файлу JSON Lines на пару и разрешение (<PAIR>.<resolution>.jsonl),
+    строка - бар [start, o, h, l, c, count, last] (last - время последней точки бара). Закрытые бары только дописываются,
+    перезаписывается лишь последняя строка с открытым баром. Изменения открытого бара
+    копятся в памяти и пишутся при закрытии бара или flush() (опрос без смены баров не пишет на диск)
+    '''
+    
+    def __init__(self, directory: str, max_bars: Dict[str, int]):
+        self.directory = directory
+        self.max_bars = max_bars
+        os.makedirs(directory, exist_ok=True)
+        self._bars: Dict[str, Dict[str, List[List[float]]]] = {}
+        # Смещение строки открытого бара и число строк в каждом файле
+        self._open_offset: Dict[Tuple[str, str], int] = {}
+        self._file_bars: Dict[Tuple[str, str], int] = {}
+        # Пары и разрешения, чей открытый бар на диске отстает от памяти
+        self._dirty: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+        self._load()
+        atexit.register(self.flush)
+    
+    def _path(self, pair: str, resolution: str) -> str:
+        return os.path.join(self.directory, f'{pair}.{resolution}{FILE_SUFFIX}')
+    
+    def _load(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith(FILE_SUFFIX):
+                continue
+            pair, _, resolution = name[:-len(FILE_SUFFIX)].rpartition('.')
+            if not pair or resolution not in RESOLUTIONS:
+                continue
+            self._load_file(pair, resolution)
+    
+    def _load_file(self, pair: str, resolution: str):
+        path = self._path(pair, resolution)
+        bars: List[List[float]] = []
+        offset = valid_end = open_offset = 0
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        bar = json.loads(line)
+                    except ValueError:
+                        bar = None
+                    # Бары без last записаны до его появления
+                    if not line.endswith(b'\n') or not isinstance(bar, list) or len(bar) not in (COUNT + 1, LAST + 1):
+                        # Оборванная при сбое последняя строка
+                        break
+                    bars.append(bar)
+                    open_offset = offset
+                    offset += len(line)
+                    valid_end = offset
+        except OSError:
+            return
+        
+        if valid_end != os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(valid_end)
+        
+        key = (pair, resolution)
+        self._open_offset[key] = open_offset
+        self._file_bars[key] = len(bars)
+        limit = self.max_bars.get(resolution)
+        if limit and len(bars) > limit:
+            del bars[:len(bars) - limit]
+        self._bars.setdefault(pair, {})[resolution] = bars
+    
+    def update(self, rates: Dict[str, float], timestamp: float):
+        '''
+        Учет снимка курсов во всех разрешениях и сохранение изменившихся баров на диск
+        '''
+        with self._lock:
+            for pair, rate in rates.items():
+                if rate is None:
+                    continue
+                pair = pair.upper()
+                pair_bars = self._bars.setdefault(pair, {})
+                for resolution, seconds in RESOLUTIONS.items():
+                    bars = pair_bars.setdefault(resolution, [])
+                    change = self._apply(bars, int(timestamp // seconds * seconds), float(rate), timestamp)
+                    limit = self.max_bars.get(resolution)
+                    if limit and len(bars) > limit:
+                        del bars[:len(bars) - limit]
+                    self._persist(pair, resolution, bars, change)
+    
+    def _apply(self, bars: List[List[float]], start: int, rate: float, timestamp: float) -> str:
+        '''
+        Обновление бара с началом start точкой rate во время timestamp (новый бар, если его еще нет).
+        Закрытие бара - курс хронологически последней точки, а не последней пришедшей.
+        Возвращает вид изменения: 'append' - открыт новый бар, 'open' - обновлен
+        открытый бар, 'rewrite' - изменен или вставлен более ранний бар
+        '''
+        if not bars or bars[-1][START] < start:
+            bars.append([start, rate, rate, rate, rate, 1, timestamp])
+            return 'append'
+        
+        # Обычно это последний бар; запоздавшая точка попадает в свой бар по бинарному поиску
+        if bars[-1][START] == start:
+            position = len(bars) - 1
+        else:
+            position = bisect_left([bar[START] for bar in bars], start)
+            if bars[position][START] != start:
+                bars.insert(position, [start, rate, rate, rate, rate, 1, timestamp])
+                return 'rewrite'
+        
+        bar = bars[position]
+        bar[HIGH] = max(bar[HIGH], rate)
+        bar[LOW] = min(bar[LOW], rate)
+        if len(bar) <= LAST:
+            bar.append(bar[START])
+        if timestamp >= bar[LAST]:
+            bar[CLOSE] = rate
+            bar[LAST] = timestamp
+        bar[COUNT] += 1
+        return 'open' if position == len(bars) - 1 else 'rewrite'
+    
+    def _persist(self, pair: str, resolution: str, bars: List[List[float]], change: str):
+        key = (pair, resolution)
+        file_bars = self._file_bars.get(key, 0)
+        # Вытесненные бары убираются из файла перезаписью, когда их накопится столько же, сколько хранится
+        if change == 'rewrite' or not file_bars or file_bars > 2 * len(bars):
+            self._rewrite(pair, resolution, bars)
+            return
+        
+        if change == 'open':
+            self._dirty.add(key)
+            return
+        if len(bars) < 2:
+            # Закрытый бар уже вытеснен (max_bars = 1)
+            self._rewrite(pair, resolution, bars)
+            return
+        
+        # Новый бар: строка открытого бара заменяется окончательным закрытым баром, за ней - новый открытый
+        closed = self._line(bars[-2])
+        self._write_tail(key, [closed, self._line(bars[-1])])
+        self._open_offset[key] += len(closed)
+        self._file_bars[key] = file_bars + 1
+    
+    def _line(self, bar: List[float]) -> bytes:
+        return json.dumps(bar, separators=(',', ':')).encode('utf-8') + b'\n'
+    
+    def _write_tail(self, key: Tuple[str, str], lines: List[bytes]):
+        '''
+        Перезапись файла начиная со строки открытого бара
+        '''
+        with open(self._path(*key), 'r+b') as f:
+            f.seek(self._open_offset[key])
+            f.writelines(lines)
+            f.truncate()
+        self._dirty.discard(key)
+    
+    def flush(self):
+        '''
+        Запись накопленных изменений открытых баров
+        '''
+        with self._lock:
+            for key in list(self._dirty):
+                pair, resolution = key
+                bars = self._bars.get(pair, {}).get(resolution)
+                if bars:
+                    self._write_tail(key, [self._line(bars[-1])])
+                else:
+                    self._dirty.discard(key)
+    
+    def _rewrite(self, pair: str, resolution: str, bars: List[List[float]]):
+        path = self._path(pair, resolution)
+        lines = [self._line(bar) for bar in bars]
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.candles.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.writelines(lines)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        
+        key = (pair, resolution)
+        self._file_bars[key] = len(bars)
+        self._open_offset[key] = sum(len(line) for line in lines[:-1])
+        self._dirty.discard(key)
+    
+    def get_bars(self, pair: str, resolution: str = '1h', limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        '''
+        Последние бары пары на разрешении (от старых к новым)
+        '''
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f'Ошибка: Неизвестное разрешение свечей "{resolution}"')
+        
+        with self._lock:
+            bars = list(self._bars.get(pair.upper(), {}).get(resolution, []))
+        if limit is not None:
+            bars = bars[-limit:]
+        return [
+            {
+                'start': bar[START],
+                'open': bar[OPEN],
+                'high': bar[HIGH],
+                'low': bar[LOW],
+                'close': bar[CLOSE],
+                'count': bar[COUNT]
+            }
+            for bar in bars
+        ]
@@ -0,0 +1,111 @@
+# valutatrade_hub/parser_service/circuit_breaker.py
+import threading
+import time
+from typing import Any, Dict, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+# Автомат отключения недоступного источника
+class CircuitBreaker:
+    '''
+    closed - запросы идут как обычно, считаются неудачи подряд;
+    open - после failure_threshold неудач запросы не выполняются recovery_seconds секунд;
+    half_open - по истечении паузы пропускается один пробный запрос:
+    успех закрывает автомат, неудача снова открывает его
+    '''
+    
+    def __init__(self, failure_threshold: int = 3, recovery_seconds: float = 300.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+    
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.recovery_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+    
+    def is_blocked(self) -> bool:
+        '''
+        Запрос сейчас точно не будет пропущен (проверка без захвата пробного запроса)
+        '''
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return state == OPEN or (state == HALF_OPEN and self._probe_in_flight)
+    
+    def allow_request(self) -> bool:
+        '''
+        Можно ли выполнить запрос сейчас (в half_open - только один пробный)
+        '''
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+    
+    def is_probing(self) -> bool:
+        with self._lock:
+            return self._state == HALF_OPEN
+    
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+            self._last_error = None
+    
+    def release_probe(self):
+        '''
+        Пробный запрос завершился без оценки доступности источника (например, 429) -
+        следующий запрос снова может стать пробным
+        '''
+        with self._lock:
+            self._probe_in_flight = False
+    
+    def record_failure(self, error: Optional[Exception] = None):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error) if error is not None else None
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+    
+    def retry_in(self) -> float:
+        '''
+        Секунд до пробного запроса (0 если автомат не открыт)
+        '''
+        with self._lock:
+            if self._current_state(time.monotonic()) != OPEN:
+                return 0.0
+            return max(0.0, self.recovery_seconds - (time.monotonic() - self._opened_at))
+    
+    def snapshot(self) -> Dict[str, Any]:
+        '''
+        Состояние для отображения в статусе парсера
+        '''
+        retry_in = self.retry_in()
+        with self._lock:
+            return {
+                'state': self._current_state(time.monotonic()),
+                'failures': self._failures,
+                'retry_in': retry_in,
+                'last_error': self._last_error
+            }
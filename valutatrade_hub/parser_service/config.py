@@ -1,7 +1,9 @@
 # valutatrade_hub/parser_service/config.py
+import json
 import os
 from dataclasses import dataclass
-from typing import Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
 
 
 @dataclass
@@ -26,17 +28,85 @@ class ParserConfig:
     # Сопоставление кодов криптовалют с ID в CoinGecko
     CRYPTO_ID_MAP: Dict[str, str] = None
     
+    # Файл со списком отслеживаемых криптовалют (заменяет CRYPTO_CURRENCIES и CRYPTO_ID_MAP):
+    # JSON-объект {"BTC": "bitcoin", ...} или список [{"symbol": "btc", "id": "bitcoin"}, ...]
+    CRYPTO_UNIVERSE_FILE: Optional[str] = None
+    
+    # Ограничение длины URL одного запроса к CoinGecko и число параллельных запросов
+    COINGECKO_MAX_URL_LENGTH: int = 2000
+    FETCH_WORKERS: int = 4
+    
+    # Асинхронный опрос: максимум одновременных запросов и таймаут одного запроса с повторами
+    MAX_IN_FLIGHT_REQUESTS: int = 8
+    FETCH_TIMEOUT_SECONDS: float = 40.0
+    
     # Параметры запросов
     REQUEST_TIMEOUT: int = 30
     REQUEST_RETRIES: int = 3
     RETRY_DELAY: float = 1.0
+    RETRY_MAX_DELAY: float = 30.0
+    
+    # Автомат отключения источника: число неудач подряд и пауза до пробного запроса
+    CIRCUIT_FAILURE_THRESHOLD: int = 3
+    CIRCUIT_RECOVERY_SECONDS: float = 300.0
+    
+    # Лимиты частоты запросов по источникам: (запросов в минуту, размер пачки)
+    # и максимальное ожидание свободного токена перед запросом
+    RATE_LIMITS: Dict[str, Tuple[float, int]] = None
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 5.0
+    
+    # Общий дедлайн одного обновления (источники опрашиваются параллельно)
+    UPDATE_DEADLINE_SECONDS: float = 45.0
     
     # Пути к файлам
     RATES_FILE_PATH: str = 'data/rates.json'
     HISTORY_FILE_PATH: str = 'data/exchange_rates.json'
+    # Жесткий предел записей в exchange_rates.json (файл переписывается целиком на каждом цикле;
+    # долгосрочная история - во временных рядах)
+    HISTORY_MAX_RECORDS: int = 1000
+    
+    # Кеш HTTP-ответов API (ETag / Last-Modified / Cache-Control)
+    HTTP_CACHE_FILE_PATH: str = 'data/http_cache.json'
+    
+    # История снимков в JSON Lines: каталог сегментов и условия ротации
+    HISTORY_DIR: str = 'data/history'
+    HISTORY_SEGMENT_MAX_BYTES: int = 1024 * 1024
+    HISTORY_SEGMENT_MAX_AGE_HOURS: float = 24.0
+    
+    # Хранение истории: полная детализация, затем поминутно и почасово; период фонового прореживания
+    RETENTION_FULL_HOURS: float = 24.0
+    RETENTION_MINUTE_DAYS: float = 7.0
+    RETENTION_HOUR_DAYS: float = 365.0
+    RETENTION_INTERVAL_MINUTES: float = 60.0
+    
+    # Порог относительного изменения курса для публикации по классам активов:
+    # пары, сдвинувшиеся меньше, не перезаписываются и не попадают в историю
+    # (PARSER_PUBLISH_EPSILON=crypto:0.00001,fiat:0.000001)
+    PUBLISH_EPSILON: Dict[str, float] = None
+    
+    # OHLC-свечи: каталог (файл на пару и разрешение) и число хранимых баров на разрешение
+    # (сутки минут, месяц часов, 5 лет дней)
+    CANDLES_DIR: str = 'data/candles'
+    CANDLE_MAX_BARS: Dict[str, int] = None
     
     # Параметры обновления
     UPDATE_INTERVAL_MINUTES: int = 5
+    
+    # Интервалы опроса отдельных источников (по умолчанию UPDATE_INTERVAL_MINUTES;
+    # PARSER_SOURCE_INTERVALS=coingecko:2,exchangerate:30),
+    # политика пропущенных запусков ('skip' - пропустить, 'catch_up' - выполнить подряд)
+    # и пауза перед повтором после ошибки планировщика
+    SOURCE_INTERVALS_MINUTES: Dict[str, float] = None
+    MISSED_TICK_POLICY: str = 'skip'
+    ERROR_RETRY_SECONDS: float = 30.0
+    
+    # Адаптивный интервал по волатильности: границы интервала источников в минутах,
+    # целевое относительное изменение курса за один опрос и окно усреднения (в снимках).
+    # Адаптация включается явно (например, {'coingecko': (1.0, 15.0)} или PARSER_ADAPTIVE_BOUNDS=coingecko:1-15);
+    # источники без границ или с явным интервалом в SOURCE_INTERVALS_MINUTES опрашиваются с фиксированным интервалом
+    ADAPTIVE_INTERVAL_BOUNDS_MINUTES: Dict[str, Tuple[float, float]] = None
+    ADAPTIVE_TARGET_CHANGE: float = 0.002
+    ADAPTIVE_WINDOW: int = 5
     RATES_TTL_SECONDS: int = 300
     
     def __post_init__(self):
@@ -52,6 +122,29 @@ class ParserConfig:
                 'DOT': 'polkadot'
             }
         
+        if self.CRYPTO_UNIVERSE_FILE:
+            self.CRYPTO_ID_MAP = self.load_crypto_universe(self.CRYPTO_UNIVERSE_FILE)
+            self.CRYPTO_CURRENCIES = tuple(self.CRYPTO_ID_MAP)
+        
+        if self.SOURCE_INTERVALS_MINUTES is None:
+            self.SOURCE_INTERVALS_MINUTES = {}
+        
+        if self.ADAPTIVE_INTERVAL_BOUNDS_MINUTES is None:
+            self.ADAPTIVE_INTERVAL_BOUNDS_MINUTES = {}
+        
+        if self.RATE_LIMITS is None:
+            # Корзина CoinGecko вмещает все части списка монет, чтобы один цикл не упирался в лимит
+            self.RATE_LIMITS = {
+                'coingecko': (10.0, max(3, len(self.get_coingecko_param_chunks()))),
+                'exchangerate': (2.0, 2)
+            }
+        
+        # Заданные пороги дополняют значения по умолчанию для остальных классов активов
+        self.PUBLISH_EPSILON = {'crypto': 1e-5, 'fiat': 1e-6, **(self.PUBLISH_EPSILON or {})}
+        
+        if self.CANDLE_MAX_BARS is None:
+            self.CANDLE_MAX_BARS = {'1m': 1440, '1h': 720, '1d': 1825}
+        
         # Создаем директорию для данных если не существует
         os.makedirs(os.path.dirname(self.RATES_FILE_PATH), exist_ok=True)
     
@@ -62,11 +155,51 @@ class ParserConfig:
         '''
         return cls(
             EXCHANGERATE_API_KEY=os.getenv('EXCHANGERATE_API_KEY'), ##0ff884936b0c965c72c31e69
+            CRYPTO_UNIVERSE_FILE=os.getenv('PARSER_CRYPTO_UNIVERSE') or None,
             REQUEST_TIMEOUT=int(os.getenv('PARSER_REQUEST_TIMEOUT', '30')),
+            UPDATE_DEADLINE_SECONDS=float(os.getenv('PARSER_UPDATE_DEADLINE', '45')),
             UPDATE_INTERVAL_MINUTES=int(os.getenv('PARSER_UPDATE_INTERVAL', '5')),
-            RATES_TTL_SECONDS=int(os.getenv('RATES_TTL_SECONDS', '300'))
+            MISSED_TICK_POLICY=os.getenv('PARSER_MISSED_TICK_POLICY', 'skip'),
+            RATES_TTL_SECONDS=int(os.getenv('RATES_TTL_SECONDS', '300')),
+            SOURCE_INTERVALS_MINUTES=cls._env_mapping('PARSER_SOURCE_INTERVALS', float),
+            ADAPTIVE_INTERVAL_BOUNDS_MINUTES=cls._env_mapping('PARSER_ADAPTIVE_BOUNDS', cls._parse_bounds),
+            PUBLISH_EPSILON=cls._env_mapping('PARSER_PUBLISH_EPSILON', float)
         )
     
+    @staticmethod
+    def _env_mapping(name: str, parse_value) -> Optional[Dict[str, Any]]:
+        '''
+        Словарь из переменной окружения вида "ключ:значение,ключ:значение"
+        (None если переменная не задана)
+        '''
+        raw = os.getenv(name)
+        if not raw:
+            return None
+        
+        mapping = {}
+        for item in raw.split(','):
+            key, separator, value = item.partition(':')
+            if not separator or not key.strip():
+                raise ValueError(f'Ошибка: Неверный формат {name}: "{item}" (ожидается ключ:значение)')
+            try:
+                mapping[key.strip()] = parse_value(value.strip())
+            except ValueError:
+                raise ValueError(f'Ошибка: Неверное значение {name} для "{key.strip()}": "{value.strip()}"')
+        return mapping
+    
+    @staticmethod
+    def _parse_bounds(value: str) -> Tuple[float, float]:
+        '''
+        Границы интервала "мин-макс" в минутах
+        '''
+        low, separator, high = value.partition('-')
+        if not separator:
+            raise ValueError(value)
+        bounds = (float(low), float(high))
+        if not 0 < bounds[0] <= bounds[1]:
+            raise ValueError(value)
+        return bounds
+    
     def validate(self) -> bool:
         '''
         Валидация конфигурации
@@ -77,10 +210,14 @@ class ParserConfig:
             print('   https://app.exchangerate-api.com/sign-up')
             print('   и установите переменную окружения EXCHANGERATE_API_KEY')
         
-        # Проверяем коды валют
-        if not all(currency.isalpha() and currency.isupper() 
-                  for currency in self.FIAT_CURRENCIES + self.CRYPTO_CURRENCIES):
+        # Проверяем коды валют (тикеры криптовалют могут содержать цифры, например 1INCH)
+        if not all(currency.isalpha() and currency.isupper() for currency in self.FIAT_CURRENCIES):
             raise ValueError('Ошибка: Коды валют должны быть в верхнем регистре и содержать только буквы')
+        if not all(currency.isalnum() and currency.isupper() for currency in self.CRYPTO_CURRENCIES):
+            raise ValueError('Ошибка: Коды криптовалют должны быть в верхнем регистре и содержать только буквы и цифры')
+        
+        if self.MISSED_TICK_POLICY not in ('skip', 'catch_up'):
+            raise ValueError(f'Ошибка: Неизвестная политика пропущенных запусков "{self.MISSED_TICK_POLICY}"')
         
         # Создаем директорию для данных
         data_dir = os.path.dirname(self.RATES_FILE_PATH)
@@ -93,20 +230,60 @@ class ParserConfig:
         
         return True
     
-    def get_coingecko_params(self) -> Dict[str, str]:
+    def get_coingecko_param_chunks(self) -> List[Dict[str, str]]:
         '''
-        Получение параметров для запроса к CoinGecko (без ключа)
+        Параметры запросов к CoinGecko, разбитые так, чтобы URL каждого запроса
+        не превышал COINGECKO_MAX_URL_LENGTH
         '''
-        crypto_ids = ','.join(
-            self.CRYPTO_ID_MAP[currency] 
-            for currency in self.CRYPTO_CURRENCIES 
+        ids = [
+            self.CRYPTO_ID_MAP[currency]
+            for currency in self.CRYPTO_CURRENCIES
             if currency in self.CRYPTO_ID_MAP
-        )
+        ]
+        vs_currency = self.BASE_CURRENCY.lower()
+        
+        def url_length(chunk_ids: List[str]) -> int:
+            return len(self.COINGECKO_URL) + 1 + len(urlencode({'ids': ','.join(chunk_ids), 'vs_currencies': vs_currency}))
+        
+        chunks: List[List[str]] = []
+        current: List[str] = []
+        for gecko_id in dict.fromkeys(ids):
+            if current and url_length(current + [gecko_id]) > self.COINGECKO_MAX_URL_LENGTH:
+                chunks.append(current)
+                current = []
+            current.append(gecko_id)
+        if current or not chunks:
+            chunks.append(current)
+        
+        return [{'ids': ','.join(chunk), 'vs_currencies': vs_currency} for chunk in chunks]
+    
+    @staticmethod
+    def load_crypto_universe(path: str) -> Dict[str, str]:
+        '''
+        Загрузка списка криптовалют: код -> ID в CoinGecko
+        '''
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f'Ошибка: Не удалось загрузить список криптовалют {path}: {e}')
+        
+        if isinstance(raw, dict):
+            items = raw.items()
+        elif isinstance(raw, list):
+            items = ((item.get('symbol', ''), item.get('id', '')) for item in raw if isinstance(item, dict))
+        else:
+            raise ValueError(f'Ошибка: Неверный формат списка криптовалют {path}')
         
-        return {
-            'ids': crypto_ids,
-            'vs_currencies': self.BASE_CURRENCY.lower()
-        }
+        universe = {}
+        for code, gecko_id in items:
+            code = str(code).upper()
+            # Первый ID для тикера выигрывает: в CoinGecko тикеры не уникальны
+            if code and gecko_id and code not in universe:
+                universe[code] = str(gecko_id)
+        if not universe:
+            raise ValueError(f'Ошибка: Список криптовалют {path} пуст')
+        return universe
     
     def get_exchangerate_url(self) -> str:
         '''
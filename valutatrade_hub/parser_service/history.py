@@ -0,0 +1,117 @@
+# valutatrade_hub/parser_service/history.py
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from ..logging_config import get_logger
+
+SEGMENT_PREFIX = 'exchange_rates.'
+SEGMENT_SUFFIX = '.jsonl'
+
+
+# Журнал истории курсов в формате JSON Lines с ротацией сегментов
+class HistoryLog:
+    '''
+    История снимков курсов: по строке JSON на обновление в файлах-сегментах
+    data/history/exchange_rates.<время создания>.jsonl.
+    Запись - один вызов write() в конец активного сегмента, без чтения файла.
+    Новый сегмент начинается при превышении размера или возраста активного
+    '''
+    
+    def __init__(self, config):
+        self.config = config
+        self.history_dir = config.HISTORY_DIR
+        self.max_bytes = config.HISTORY_SEGMENT_MAX_BYTES
+        self.max_age = config.HISTORY_SEGMENT_MAX_AGE_HOURS * 3600
+        self.logger = get_logger('history')
+        
+        if not os.path.isdir(self.history_dir):
+            os.makedirs(self.history_dir, exist_ok=True)
+            self._import_legacy(config.HISTORY_FILE_PATH)
+    
+    def segments(self) -> List[str]:
+        '''
+        Пути сегментов от старых к новым
+        '''
+        try:
+            names = os.listdir(self.history_dir)
+        except FileNotFoundError:
+            return []
+        
+        segments = []
+        for name in names:
+            created = self._segment_created(name)
+            if created is not None:
+                segments.append((created, name))
+        return [os.path.join(self.history_dir, name) for _, name in sorted(segments)]
+    
+    def _segment_created(self, name: str) -> Optional[int]:
+        if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+            return None
+        try:
+            return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+        except ValueError:
+            return None
+    
+    def _active_segment(self, incoming_bytes: int) -> str:
+        '''
+        Активный сегмент для записи (с ротацией по размеру и возрасту)
+        '''
+        segments = self.segments()
+        now = int(time.time())
+        if segments:
+            path = segments[-1]
+            created = self._segment_created(os.path.basename(path))
+            size = os.path.getsize(path)
+            if size + incoming_bytes <= self.max_bytes and now - created < self.max_age:
+                return path
+            now = max(now, created + 1)
+        return os.path.join(self.history_dir, f'{SEGMENT_PREFIX}{now}{SEGMENT_SUFFIX}')
+    
+    def append(self, record: Dict[str, Any]):
+        '''
+        Дозапись одного снимка одной строкой
+        '''
+        line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        path = self._active_segment(len(line))
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        '''
+        Потоковое чтение всех записей от старых к новым без загрузки файлов целиком
+        '''
+        for path in self.segments():
+            try:
+                f = open(path, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            with f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # Оборванная строка при сбое во время записи
+                        continue
+    
+    def _import_legacy(self, legacy_path: str):
+        '''
+        Перенос снимков из старого exchange_rates.json в первый сегмент
+        '''
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        
+        snapshots = [record for record in legacy if isinstance(record, dict) and 'rates' in record] if isinstance(legacy, list) else []
+        for record in snapshots:
+            self.append(record)
+        if snapshots:
+            self.logger.info(f'Imported {len(snapshots)} history snapshots from {legacy_path}')
@@ -0,0 +1,154 @@
+# valutatrade_hub/parser_service/http_cache.py
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+
+# Кеш HTTP-ответов API с условными запросами
+class ResponseCache:
+    '''
+    Ответы API по ключу sha256(url + параметры): тело, ETag, Last-Modified
+    и момент, до которого ответ свежий (Cache-Control max-age, Expires
+    или time_next_update_unix из тела ответа).
+    Ключ - хеш, поэтому API-ключ из URL не попадает на диск.
+    Сохраняется в компактный JSON и переживает перезапуск
+    '''
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load()
+    
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict] = None) -> str:
+        payload = json.dumps([url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._entries = {}
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._entries.get(key)
+    
+    def is_fresh(self, entry: Dict[str, Any], now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        expires_at = entry.get('expires_at')
+        return expires_at is not None and now < expires_at
+    
+    def conditional_headers(self, entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        '''
+        Заголовки условного запроса для перепроверки закешированного ответа
+        '''
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+    
+    def store(self, key: str, headers, body: Any, now: Optional[float] = None) -> Dict[str, Any]:
+        '''
+        Сохранение полного ответа (200)
+        '''
+        now = time.time() if now is None else now
+        entry = {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'expires_at': self._expires_at(headers, body, now),
+            'fetched_at': now,
+            'body': body
+        }
+        if self._no_store(headers):
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._save()
+        return entry
+    
+    def revalidate(self, key: str, headers, now: Optional[float] = None) -> Dict[str, Any]:
+        '''
+        Продление закешированного ответа после 304 Not Modified
+        '''
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries[key]
+            entry['etag'] = headers.get('ETag') or entry.get('etag')
+            entry['last_modified'] = headers.get('Last-Modified') or entry.get('last_modified')
+            entry['expires_at'] = self._expires_at(headers, entry['body'], now)
+            entry['fetched_at'] = now
+            self._save()
+            return entry
+    
+    def _no_store(self, headers) -> bool:
+        return 'no-store' in headers.get('Cache-Control', '').lower()
+    
+    def _expires_at(self, headers, body: Any, now: float) -> Optional[float]:
+        '''
+        Момент устаревания ответа: Cache-Control, затем Expires, затем time_next_update_unix
+        '''
+        cache_control = headers.get('Cache-Control', '').lower()
+        directives = {}
+        for part in cache_control.split(','):
+            name, _, value = part.strip().partition('=')
+            directives[name] = value.strip('"')
+        
+        if 'no-cache' in directives or 'no-store' in directives:
+            return None
+        for name in ('s-maxage', 'max-age'):
+            if name in directives:
+                try:
+                    age = float(headers.get('Age', 0) or 0)
+                    return now + max(0.0, float(directives[name]) - age)
+                except ValueError:
+                    break
+        
+        if headers.get('Expires'):
+            try:
+                return parsedate_to_datetime(headers['Expires']).timestamp()
+            except (TypeError, ValueError):
+                pass
+        
+        if isinstance(body, dict) and isinstance(body.get('time_next_update_unix'), (int, float)):
+            return float(body['time_next_update_unix'])
+        return None
+    
+    def _save(self):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.http_cache.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, separators=(',', ':'), ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(path: str) -> ResponseCache:
+    '''
+    Общий кеш для файла path (все клиенты процесса пишут в один объект)
+    '''
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = ResponseCache(path)
+        return _caches[path]
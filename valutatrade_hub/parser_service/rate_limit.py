@@ -0,0 +1,74 @@
+# valutatrade_hub/parser_service/rate_limit.py
+import threading
+import time
+from typing import Optional
+
+
+# Ограничитель частоты запросов к API
+class TokenBucket:
+    '''
+    Корзина токенов: пополняется со скоростью rate_per_minute, вмещает не более burst.
+    Каждый запрос к API забирает один токен
+    '''
+    
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def _wait_time(self, now: float, tokens: float = 1) -> float:
+        self._refill(now)
+        blocked = max(0.0, self._blocked_until - now)
+        if self._tokens >= tokens:
+            return blocked
+        if self.rate <= 0:
+            return float('inf')
+        return max(blocked, (tokens - self._tokens) / self.rate)
+    
+    def wait_time(self, tokens: float = 1) -> float:
+        '''
+        Секунд до накопления tokens токенов (0 - можно выполнять запросы).
+        Для tokens больше размера корзины - время, за которое они будут выданы по очереди
+        '''
+        with self._lock:
+            return self._wait_time(time.monotonic(), tokens)
+    
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._wait_time(time.monotonic()) > 0:
+                return False
+            self._tokens -= 1
+            return True
+    
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        '''
+        Получение токена с ожиданием не дольше timeout секунд (None - без ограничения)
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                if wait <= 0:
+                    self._tokens -= 1
+                    return True
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+    
+    def block_for(self, seconds: float):
+        '''
+        Запрет запросов на seconds секунд (ответ 429 с Retry-After) с опустошением корзины
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, now + seconds)
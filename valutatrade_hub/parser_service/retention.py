@@ -0,0 +1,181 @@
+# valutatrade_hub/parser_service/retention.py
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..logging_config import get_logger
+
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+
+# Политика хранения истории по уровням детализации
+class RetentionPolicy:
+    '''
+    Полная детализация за последние full_resolution_hours часов,
+    дальше - последняя точка каждой минуты до minute_days дней,
+    затем последняя точка каждого часа до hour_days дней; более старое удаляется
+    '''
+    
+    def __init__(self, full_resolution_hours: float = 24, minute_days: float = 7, hour_days: float = 365):
+        self.full_resolution = full_resolution_hours * HOUR
+        self.minute_retention = minute_days * DAY
+        self.hour_retention = hour_days * DAY
+    
+    @classmethod
+    def from_config(cls, config) -> 'RetentionPolicy':
+        return cls(config.RETENTION_FULL_HOURS, config.RETENTION_MINUTE_DAYS, config.RETENTION_HOUR_DAYS)
+    
+    def _bucket(self, timestamp: float, now: float) -> Optional[Tuple[int, int]]:
+        '''
+        Корзина прореживания для точки: None - удалить, (0, 0) - хранить как есть
+        '''
+        age = now - timestamp
+        if age <= self.full_resolution:
+            return (0, 0)
+        if age <= self.minute_retention:
+            return (MINUTE, int(timestamp // MINUTE))
+        if age <= self.hour_retention:
+            return (HOUR, int(timestamp // HOUR))
+        return None
+    
+    def downsample(self, points: List[Tuple[float, Any]], now: Optional[float] = None,
+                   merge: Optional[Callable[[Any, Any], Any]] = None) -> List[Tuple[float, Any]]:
+        '''
+        Прореживание точек (время, значение), отсортированных по времени.
+        merge(старое, новое) - объединение значений одной корзины (по умолчанию остается последнее)
+        '''
+        now = time.time() if now is None else now
+        kept: List[Tuple[float, Any]] = []
+        last_bucket = None
+        for point in points:
+            bucket = self._bucket(point[0], now)
+            if bucket is None:
+                continue
+            if bucket != (0, 0) and bucket == last_bucket:
+                # В корзине остается последняя точка
+                kept[-1] = (point[0], merge(kept[-1][1], point[1])) if merge else point
+            else:
+                kept.append(point)
+            last_bucket = bucket
+        return kept
+    
+    def is_full_resolution(self, timestamp: float, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return now - timestamp <= self.full_resolution
+
+
+def merge_history_records(previous: Dict[str, Any], record: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Объединение снимков истории одной корзины: дельта накладывается на предыдущие курсы
+    '''
+    if not record.get('delta'):
+        return record
+    rates = {**previous.get('rates', {}), **record.get('rates', {})}
+    return {**record, 'rates': rates, 'total_pairs': len(rates), 'delta': previous.get('delta', False)}
+
+
+def record_timestamp(record: Dict[str, Any]) -> Optional[float]:
+    '''
+    Время записи истории в unix-секундах (None если не удалось разобрать)
+    '''
+    try:
+        return datetime.fromisoformat(record['timestamp']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+# Фоновое применение политики хранения
+class RetentionManager:
+    '''
+    Периодически прореживает временные ряды курсов и закрытые сегменты
+    JSONL-истории согласно RetentionPolicy в отдельном потоке
+    '''
+    
+    def __init__(self, policy: RetentionPolicy, series_store, history_log, interval_seconds: float):
+        self.policy = policy
+        self.series_store = series_store
+        self.history_log = history_log
+        self.interval = interval_seconds
+        self.logger = get_logger('retention')
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def compact_once(self, now: Optional[float] = None) -> Dict[str, int]:
+        '''
+        Один проход прореживания, возвращает число удаленных точек и записей
+        '''
+        now = time.time() if now is None else now
+        return {
+            'series_points_removed': self._compact_series(now),
+            'history_records_removed': self._compact_history(now)
+        }
+    
+    def _compact_series(self, now: float) -> int:
+        def downsample(points):
+            if not points or self.policy.is_full_resolution(points[0][0], now):
+                return points
+            return self.policy.downsample(points, now)
+        
+        # Чтение, прореживание и перезапись - под блокировкой хранилища,
+        # поэтому дозапись обновителя не может попасть между ними
+        return sum(self.series_store.compact(pair, downsample) for pair in self.series_store.pairs())
+    
+    def _compact_history(self, now: float) -> int:
+        '''
+        Прореживание закрытых сегментов; активный (последний) сегмент не трогается
+        '''
+        removed = 0
+        for path in self.history_log.segments()[:-1]:
+            points = []
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    timestamp = record_timestamp(record)
+                    if timestamp is not None:
+                        points.append((timestamp, record))
+            
+            kept = self.policy.downsample(sorted(points, key=lambda point: point[0]), now, merge_history_records)
+            if len(kept) == len(points):
+                continue
+            
+            removed += len(points) - len(kept)
+            if not kept:
+                os.remove(path)
+                continue
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(record, ensure_ascii=False, default=str) + '\n' for _, record in kept)
+            os.replace(tmp_path, path)
+        return removed
+    
+    def start(self):
+        '''
+        Запуск фонового прореживания
+        '''
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True, name='retention')
+        self._thread.start()
+    
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=3)
+    
+    def _run_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                stats = self.compact_once()
+                if any(stats.values()):
+                    self.logger.info(f'Retention compaction: {stats}')
+            except Exception as e:
+                self.logger.error(f'Retention compaction error: {e}')
@@ -1,25 +1,61 @@
 # valutatrade_hub/parser_service/sheduler.py
+import heapq
+import itertools
 import threading
 import time
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 from ..logging_config import get_logger
 from .config import ParserConfig
 from .updater import RatesUpdater
+from .volatility import VolatilityTracker
 
 
 class Scheduler:
     '''
-    Планировщик периодического обновления курсов
+    Планировщик периодического обновления курсов.
+    Очередь запусков - куча (момент по монотонным часам, источник): у каждого источника
+    свой интервал, поток спит в Event.wait до ближайшего запуска и просыпается сразу при stop().
+    Пропущенные запуски (долгое обновление, сон системы) обрабатываются по MISSED_TICK_POLICY.
+    Интервал источников с границами ADAPTIVE_INTERVAL_BOUNDS_MINUTES (и без явного
+    SOURCE_INTERVALS_MINUTES) подстраивается под волатильность
     '''
     
-    def __init__(self, config: ParserConfig = None):
+    def __init__(self, config: ParserConfig = None, updater: RatesUpdater = None):
         self.config = config or ParserConfig.from_env()
-        self.updater = RatesUpdater(config)
+        # Общий с CLI экземпляр, чтобы статус источников отражал фоновые обновления
+        self.updater = updater or RatesUpdater(self.config)
         self.logger = get_logger('scheduler')
         self._stop_event = threading.Event()
         self._thread: Optional[threading.Thread] = None
         self._is_running = False
+        self._queue: List[Tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._trackers: Dict[str, VolatilityTracker] = {
+            source: VolatilityTracker(
+                min_minutes * 60,
+                max_minutes * 60,
+                self._fixed_interval(source),
+                self.config.ADAPTIVE_TARGET_CHANGE,
+                self.config.ADAPTIVE_WINDOW
+            )
+            for source, (min_minutes, max_minutes) in self.config.ADAPTIVE_INTERVAL_BOUNDS_MINUTES.items()
+            # Явно заданный интервал источника важнее адаптации
+            if source in self.updater.clients and source not in self.config.SOURCE_INTERVALS_MINUTES
+        }
+    
+    def interval_seconds(self, source: str) -> float:
+        '''
+        Текущий интервал опроса источника
+        '''
+        tracker = self._trackers.get(source)
+        if tracker is not None:
+            return tracker.interval
+        return self._fixed_interval(source)
+    
+    def _fixed_interval(self, source: str) -> float:
+        minutes = self.config.SOURCE_INTERVALS_MINUTES.get(source, self.config.UPDATE_INTERVAL_MINUTES)
+        return max(1.0, minutes * 60)
     
     def start(self):
         '''
@@ -29,9 +65,16 @@ class Scheduler:
             self.logger.warning('Scheduler is already running')
             return
         
+        # Первый запуск всех источников - сразу
+        now = time.monotonic()
+        self._queue = []
+        for source in self.updater.clients:
+            self._schedule(now, source)
+        
         self._stop_event.clear()
         self._thread = threading.Thread(target=self._run_loop, daemon=True)
         self._thread.start()
+        self.updater.retention.start()
         self._is_running = True
         self.logger.info('Scheduler started')
     
@@ -45,30 +88,91 @@ class Scheduler:
         self._stop_event.set()
         if self._thread:
             self._thread.join(timeout=3)
+        self.updater.retention.stop()
+        self.updater.candles.flush()
         self._is_running = False
         self.logger.info('Scheduler stopped')
     
+    def _schedule(self, due: float, source: str):
+        heapq.heappush(self._queue, (due, next(self._sequence), source))
+    
+    def _pop_due(self, now: float) -> List[Tuple[float, str]]:
+        '''
+        Все запуски, срок которых наступил (источники с общим сроком опрашиваются одним обновлением)
+        '''
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            scheduled, _, source = heapq.heappop(self._queue)
+            due.append((scheduled, source))
+        return due
+    
+    def _next_due(self, scheduled: float, source: str, now: float) -> float:
+        '''
+        Следующий запуск источника по сетке его интервала.
+        skip - пропущенные моменты отбрасываются, следующий запуск в будущем;
+        catch_up - каждый пропущенный момент выполняется, подряд без ожидания
+        '''
+        interval = self.interval_seconds(source)
+        next_due = scheduled + interval
+        if self.config.MISSED_TICK_POLICY == 'skip' and next_due <= now:
+            missed = int((now - next_due) // interval) + 1
+            self.logger.warning(f'Skipping {missed} missed update(s) of {source}')
+            next_due += missed * interval
+        return next_due
+    
     def _run_loop(self):
         '''
         Основной цикл планировщика
         '''
         while not self._stop_event.is_set():
+            if not self._queue:
+                self._stop_event.wait()
+                break
+            
+            timeout = self._queue[0][0] - time.monotonic()
+            if timeout > 0:
+                if self._stop_event.wait(timeout):
+                    break
+                continue
+            
+            due = self._pop_due(time.monotonic())
+            sources = [source for _, source in due]
             try:
-                self.logger.debug('Running scheduled update...')
-                self.updater.run_update()
-                
-                wait_time = self.config.UPDATE_INTERVAL_MINUTES * 60
-                for _ in range(wait_time * 2):
-                    if self._stop_event.is_set():
+                # Запуск откладывается до появления токенов у ограничителей частоты,
+                # чтобы цикл не тратил запросы впустую на 429
+                delay = min(self.updater.rate_limit_delay(sources), min(self.interval_seconds(source) for source in sources))
+                if delay > 0:
+                    self.logger.debug(f'Rate limit: delaying update by {delay:.1f}s')
+                    if self._stop_event.wait(delay):
                         break
-                    time.sleep(0.5)
+                
+                self.logger.debug(f'Running scheduled update: {", ".join(sources)}')
+                self.updater.run_update(sources=sources)
+                
+                now = time.monotonic()
+                self._observe(sources, now)
+                for scheduled, source in due:
+                    self._schedule(self._next_due(scheduled, source, now), source)
                 
             except Exception as e:
                 self.logger.error(f'Scheduler error: {e}')
-                for _ in range(60):
-                    if self._stop_event.is_set():
-                        break
-                    time.sleep(0.5)
+                retry_at = time.monotonic() + self.config.ERROR_RETRY_SECONDS
+                for _, source in due:
+                    self._schedule(retry_at, source)
+    
+    def _observe(self, sources: List[str], now: float):
+        '''
+        Передача свежих курсов источников в их трекеры волатильности
+        '''
+        for source in sources:
+            tracker = self._trackers.get(source)
+            rates = self.updater.last_source_rates.get(source)
+            if tracker is None or not rates:
+                continue
+            previous = tracker.interval
+            tracker.observe(rates, now)
+            if abs(tracker.interval - previous) >= 1:
+                self.logger.info(f'Poll interval of {source}: {previous:.0f}s -> {tracker.interval:.0f}s')
     
     def run_once(self):
         '''
@@ -81,4 +185,4 @@ class Scheduler:
         '''
         Проверка запущен ли планировщик
         '''
-        return self._is_running and self._thread and self._thread.is_alive()
\ No newline at end of file
+        return self._is_running and self._thread and self._thread.is_alive()
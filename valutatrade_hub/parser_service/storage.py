@@ -1,8 +1,12 @@
 # valutatrade_hub/parser_service/storage.py
+import os
+import time
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from ..infra.database import db
+from .retention import RetentionPolicy
+from .timeseries import RateSeriesStore
 
 
 class ParserStorage:
@@ -10,52 +14,85 @@ class ParserStorage:
     Класс для работы с хранилищем данных парсера
     '''
     
+    def __init__(self, retention: Optional[RetentionPolicy] = None, max_records: int = 1000):
+        self.retention = retention or RetentionPolicy()
+        self.max_records = max_records
+        series_dir = os.path.join(db.data_dir, 'timeseries')
+        backfill = not os.path.isdir(series_dir)
+        self.series = RateSeriesStore(series_dir)
+        if backfill:
+            self._backfill_series(db.load_data('exchange_rates') or [])
+    
     def save_exchange_rate(self, rate_data: Dict[str, Any]):
         '''
         Сохранение одной записи о курсе в историю
         '''
-        def update_history(history: List) -> List:
-            rate_data['id'] = self._generate_rate_id(rate_data)
-            rate_data['timestamp'] = datetime.now().isoformat()
-            
-            history.append(rate_data)
-            return history[-1000:]
-        
-        db.update_data('exchange_rates', update_history)
+        self.save_exchange_rates_batch([rate_data])
     
-    def save_current_rates(self, rates: Dict[str, float], source: str):
+    def save_exchange_rates_batch(self, records: List[Dict[str, Any]]):
         '''
-        Сохранение текущих курсов в кеш
+        Сохранение всех записей одного цикла обновления в историю одной записью файла.
+        В exchange_rates.json остается окно полной детализации, но не более max_records
+        последних записей; прореженная долгосрочная история - во временных рядах
         '''
-        current_time = datetime.now().isoformat()
+        if not records:
+            return
         
-        rates_data = {
-            'pairs': {},
-            'last_refresh': current_time,
-            'source': source
-        }
-        
-        for pair_key, rate in rates.items():
-            rates_data['pairs'][pair_key] = {
-                'rate': rate,
-                'updated_at': current_time,
-                'source': source
-            }
+        timestamp = datetime.now().isoformat()
+        for rate_data in records:
+            rate_data['id'] = self._generate_rate_id(rate_data)
+            rate_data['timestamp'] = timestamp
         
-        db.save_data('rates', rates_data)
+        cutoff = datetime.fromtimestamp(time.time() - self.retention.full_resolution).isoformat()
+        db.append('exchange_rates', records, max_records=self.max_records, since=cutoff)
+        self._append_series(records)
+    
+    def _append_series(self, records: List[Dict[str, Any]]):
+        '''
+        Дозапись записей истории в колоночное хранилище временных рядов
+        '''
+        points = []
+        for record in records:
+            try:
+                timestamp = datetime.fromisoformat(record['timestamp']).timestamp()
+                pair = f'{record['from_currency']}_{record['to_currency']}'
+                points.append((pair, timestamp, float(record['rate'])))
+            except (KeyError, TypeError, ValueError):
+                continue
+        self.series.append_many(points)
+    
+    def _backfill_series(self, history: List[Dict[str, Any]]):
+        '''
+        Однократный перенос существующей истории exchange_rates.json во временные ряды
+        '''
+        records = [record for record in history if record.get('from_currency') and record.get('timestamp')]
+        records.sort(key=lambda record: record['timestamp'])
+        self._append_series(records)
     
-    def get_historical_rates(self, currency_pair: str, limit: int = 100) -> List[Dict]:
+    def get_historical_rates(self, currency_pair: str, limit: int = 100,
+                             start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Dict]:
         '''
-        Получение исторических данных по паре валют
+        Получение исторических данных по паре валют ('BTC_USD')
+        или по всем парам валюты ('BTC') за интервал времени
         '''
-        history = db.load_data('exchange_rates') or []
+        code = currency_pair.upper()
+        pairs = [code] if '_' in code else [pair for pair in self.series.pairs() if pair.startswith(f'{code}_')]
+        start_ts = start.timestamp() if start else None
+        end_ts = end.timestamp() if end else None
         
-        filtered = [
-            record for record in history 
-            if record.get('from_currency', '').lower() == currency_pair.lower()
-        ]
+        points = []
+        for pair in pairs:
+            from_currency, to_currency = pair.split('_', 1)
+            for timestamp, rate in self.series.query(pair, start_ts, end_ts, limit):
+                points.append({
+                    'from_currency': from_currency,
+                    'to_currency': to_currency,
+                    'rate': rate,
+                    'timestamp': datetime.fromtimestamp(timestamp).isoformat()
+                })
         
-        return filtered[-limit:]
+        points.sort(key=lambda point: point['timestamp'])
+        return points[-limit:]
     
     def _generate_rate_id(self, rate_data: Dict[str, Any]) -> str:
         '''
@@ -0,0 +1,214 @@
+# valutatrade_hub/parser_service/timeseries.py
+import mmap
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+TS_SUFFIX = '.ts.bin'
+RATE_SUFFIX = '.rate.bin'
+NEW_SUFFIX = '.new'
+
+
+# Отображенные в память колонки одной пары
+class _MappedSeries:
+    '''
+    Колонки времени и курса пары, отображенные в память только для чтения
+    '''
+    
+    def __init__(self, ts_path: str, rate_path: str):
+        self.size = (os.path.getsize(ts_path), os.path.getsize(rate_path))
+        self._maps = []
+        self.timestamps = self._map(ts_path, self.size[0])
+        self.rates = self._map(rate_path, self.size[1])
+        # Колонки могут разойтись на одну запись при сбое между дозаписями
+        self.length = min(len(self.timestamps), len(self.rates))
+    
+    def _map(self, path: str, size: int):
+        usable = size - size % 8
+        if usable == 0:
+            return array('d')
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), usable, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        view = memoryview(mapped).cast('d')
+        if sys.byteorder != 'little':
+            view = array('d', view)
+            view.byteswap()
+        return view
+    
+    def close(self):
+        for view in (self.timestamps, self.rates):
+            if isinstance(view, memoryview):
+                view.release()
+        for mapped in self._maps:
+            mapped.close()
+
+
+# Колоночное хранилище временных рядов курсов
+class RateSeriesStore:
+    '''
+    По паре два бинарных файла-колонки (little-endian double):
+    <PAIR>.ts.bin - время (unix-секунды, по возрастанию) и <PAIR>.rate.bin - курс.
+    Запись - дозапись 8 байт в каждую колонку, чтение - через mmap,
+    выборка по интервалу времени - бинарным поиском по колонке времени
+    '''
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._mapped: Dict[str, _MappedSeries] = {}
+        self._last_ts: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def _paths(self, pair: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, pair.upper())
+        return base + TS_SUFFIX, base + RATE_SUFFIX
+    
+    def _finish_rewrite(self, pair: str):
+        '''
+        Завершение прерванной перезаписи: обе новые колонки записаны полностью
+        до первого переименования, поэтому оставшиеся .new просто переименовываются
+        '''
+        for path in self._paths(pair)[::-1]:
+            if os.path.exists(path + NEW_SUFFIX):
+                os.replace(path + NEW_SUFFIX, path)
+    
+    def compact(self, pair: str, fn: Callable[[List[Tuple[float, float]]], List[Tuple[float, float]]]) -> int:
+        '''
+        Замена точек пары на fn(точки) под одной блокировкой с дозаписью,
+        чтобы точки, дописанные во время прореживания, не потерялись.
+        Возвращает число удаленных точек
+        '''
+        pair = pair.upper()
+        with self._lock:
+            points = self._query(pair)
+            kept = fn(points)
+            if len(kept) != len(points):
+                self._rewrite(pair, kept)
+            return len(points) - len(kept)
+    
+    def _rewrite(self, pair: str, points: List[Tuple[float, float]]):
+        ts_path, rate_path = self._paths(pair)
+        for path, column in ((ts_path, array('d', (p[0] for p in points))), (rate_path, array('d', (p[1] for p in points)))):
+            if sys.byteorder != 'little':
+                column.byteswap()
+            with open(path + NEW_SUFFIX, 'wb') as f:
+                f.write(column.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        
+        series = self._mapped.pop(pair, None)
+        if series is not None:
+            series.close()
+        self._finish_rewrite(pair)
+        self._last_ts.pop(pair, None)
+    
+    def pairs(self) -> List[str]:
+        '''
+        Список пар, для которых есть данные
+        '''
+        return sorted(name[:-len(TS_SUFFIX)] for name in os.listdir(self.directory) if name.endswith(TS_SUFFIX))
+    
+    def is_empty(self) -> bool:
+        return not self.pairs()
+    
+    def append_many(self, points: Iterable[Tuple[str, float, float]]):
+        '''
+        Дозапись точек (пара, unix-время, курс); время внутри пары не убывает
+        '''
+        grouped: Dict[str, List[Tuple[float, float]]] = {}
+        for pair, timestamp, rate in points:
+            grouped.setdefault(pair.upper(), []).append((timestamp, rate))
+        
+        with self._lock:
+            for pair, pair_points in grouped.items():
+                self._align(pair)
+                ts_column, rate_column = array('d'), array('d')
+                last_ts = self._last_timestamp(pair)
+                for timestamp, rate in pair_points:
+                    timestamp = max(timestamp, last_ts) if last_ts is not None else timestamp
+                    last_ts = timestamp
+                    ts_column.append(timestamp)
+                    rate_column.append(rate)
+                self._last_ts[pair] = last_ts
+                
+                for path, column in zip(self._paths(pair), (ts_column, rate_column)):
+                    if sys.byteorder != 'little':
+                        column.byteswap()
+                    with open(path, 'ab') as f:
+                        f.write(column.tobytes())
+    
+    def _align(self, pair: str):
+        '''
+        Выравнивание колонок перед дозаписью: после сбоя между записями колонок
+        более длинная обрезается до общей длины, иначе все следующие точки разъедутся
+        '''
+        self._finish_rewrite(pair)
+        paths = self._paths(pair)
+        sizes = [os.path.getsize(path) if os.path.exists(path) else 0 for path in paths]
+        length = min(sizes) - min(sizes) % 8
+        if all(size == length for size in sizes):
+            return
+        
+        series = self._mapped.pop(pair, None)
+        if series is not None:
+            series.close()
+        self._last_ts.pop(pair, None)
+        for path, size in zip(paths, sizes):
+            if size != length:
+                with open(path, 'ab') as f:
+                    f.truncate(length)
+    
+    def append(self, pair: str, timestamp: float, rate: float):
+        self.append_many([(pair, timestamp, rate)])
+    
+    def _last_timestamp(self, pair: str) -> Optional[float]:
+        if pair in self._last_ts:
+            return self._last_ts[pair]
+        series = self._series(pair)
+        if series is None or series.length == 0:
+            return None
+        return series.timestamps[series.length - 1]
+    
+    def _series(self, pair: str) -> Optional[_MappedSeries]:
+        '''
+        Отображение колонок пары; переоткрывается, если файлы выросли
+        '''
+        ts_path, rate_path = self._paths(pair)
+        if pair not in self._mapped:
+            self._finish_rewrite(pair)
+        try:
+            size = (os.path.getsize(ts_path), os.path.getsize(rate_path))
+        except OSError:
+            return None
+        
+        series = self._mapped.get(pair)
+        if series is None or series.size != size:
+            if series is not None:
+                series.close()
+            series = _MappedSeries(ts_path, rate_path)
+            self._mapped[pair] = series
+        return series
+    
+    def query(self, pair: str, start: Optional[float] = None, end: Optional[float] = None,
+              limit: Optional[int] = None) -> List[Tuple[float, float]]:
+        '''
+        Точки (время, курс) пары в интервале [start, end], последние limit штук
+        '''
+        with self._lock:
+            return self._query(pair.upper(), start, end, limit)
+    
+    def _query(self, pair: str, start: Optional[float] = None, end: Optional[float] = None,
+               limit: Optional[int] = None) -> List[Tuple[float, float]]:
+        series = self._series(pair)
+        if series is None or series.length == 0:
+            return []
+        
+        lo = 0 if start is None else bisect_left(series.timestamps, start, 0, series.length)
+        hi = series.length if end is None else bisect_right(series.timestamps, end, lo, series.length)
+        if limit is not None:
+            lo = max(lo, hi - limit)
+        return [(series.timestamps[i], series.rates[i]) for i in range(lo, hi)]
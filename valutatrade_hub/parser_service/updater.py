@@ -1,22 +1,17 @@
 # valutatrade_hub/parser_service/updater.py
+import asyncio
+import time
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
+from ..core.rates import RateSnapshot, rate_snapshots
+from .api_clients import ApiRequestError
+from .async_engine import AsyncIngestionEngine, AsyncRequestPool
+from .candles import CandleAggregator
+from .history import HistoryLog
+from .retention import RetentionManager, RetentionPolicy
+from .storage import ParserStorage
 
-# Временные классы для замены проблемных импортов
-class ApiRequestError(Exception):
-    pass
-
-class ParserStorage:
-    '''
-    Упрощенное хранилище для тестирования
-    '''
-    
-    def save_exchange_rate(self, rate_data):
-        print(f'Saving rate: {rate_data['from_currency']}_{rate_data['to_currency']} = {rate_data['rate']}')
-    
-    def save_current_rates(self, rates, source):
-        print(f'Saving {len(rates)} current rates from {source}')
 
 class RatesUpdater:
     '''
@@ -31,12 +26,27 @@ class RatesUpdater:
         self.config.validate()
         
         self.logger = self._create_simple_logger()
-        self.storage = ParserStorage()
+        retention_policy = RetentionPolicy.from_config(self.config)
+        self.storage = ParserStorage(retention_policy, self.config.HISTORY_MAX_RECORDS)
+        self.history = HistoryLog(self.config)
+        self.retention = RetentionManager(
+            retention_policy,
+            self.storage.series,
+            self.history,
+            self.config.RETENTION_INTERVAL_MINUTES * 60
+        )
+        self.candles = CandleAggregator(self.config.CANDLES_DIR, self.config.CANDLE_MAX_BARS)
         
         self.clients = {
             'coingecko': CoinGeckoClient(self.config),
             'exchangerate': ExchangeRateApiClient(self.config)
         }
+        # Курсы, полученные от каждого источника в последнем обновлении (для адаптивного планирования)
+        self.last_source_rates: Dict[str, Dict[str, float]] = {}
+        self.engine = AsyncIngestionEngine(
+            self.clients,
+            AsyncRequestPool(self.config.MAX_IN_FLIGHT_REQUESTS, self.config.FETCH_TIMEOUT_SECONDS)
+        )
     
     def _create_simple_logger(self):
         '''
@@ -49,132 +59,217 @@ class RatesUpdater:
             def debug(self, msg): print(f'Debug: {msg}')
         return SimpleLogger()
     
-    def run_update(self, source: str = None) -> Dict[str, float]:
+    def run_update(self, source: str = None, sources: Optional[List[str]] = None) -> Dict[str, float]:
         '''
-        Запуск обновления курсов
+        Запуск обновления курсов (синхронная обертка над run_update_async).
+        source - один источник, sources - несколько; по умолчанию все
+        '''
+        return asyncio.run(self.run_update_async(source, sources))
+    
+    async def run_update_async(self, source: str = None, sources: Optional[List[str]] = None) -> Dict[str, float]:
+        '''
+        Запуск обновления курсов в цикле событий
         '''
         self.logger.info('Starting rates update...')
         
+        if source:
+            sources = [source]
+        sources_to_update = []
+        for source_name in (sources or list(self.clients.keys())):
+            if source_name not in self.clients:
+                self.logger.warning(f'Unknown source: {source_name}')
+                continue
+            sources_to_update.append(source_name)
+            self.logger.info(f'Fetching rates from {source_name}...')
+        
+        # Источники и части их запросов опрашиваются параллельно,
+        # не дождавшиеся дедлайна отбрасываются в этом цикле
+        results = await self.engine.fetch_all(sources_to_update, self.config.UPDATE_DEADLINE_SECONDS)
+        return self._apply_results(results)
+    
+    def _apply_results(self, results: Dict[str, Any]) -> Dict[str, float]:
+        '''
+        Объединение результатов источников и запись изменившихся курсов
+        '''
         all_rates = {}
+        changed_rates = {}
+        changed_sources = {}
         successful_sources = []
+        history_records = []
+        self.last_source_rates = {}
+        # Изменения считаются относительно последнего опубликованного снимка,
+        # поэтому медленный дрейф в пределах эпсилон накапливается и со временем публикуется
+        published_snapshot = rate_snapshots.current()
+        published = published_snapshot.rates
         
-        sources_to_update = [source] if source else list(self.clients.keys())
-        
-        for source_name in sources_to_update:
-            if source_name not in self.clients:
-                self.logger.warning(f'Unknown source: {source_name}')
+        late_sources = []
+        for source_name, rates in results.items():
+            if isinstance(rates, asyncio.TimeoutError):
+                late_sources.append(source_name)
+                continue
+            if isinstance(rates, ApiRequestError):
+                self.logger.error(f'API error from {source_name}: {rates}')
+                continue
+            if isinstance(rates, Exception):
+                self.logger.error(f'Unexpected error from {source_name}: {rates}')
+                continue
+            
+            if not rates:
+                self.logger.warning(f'No rates returned from {source_name}')
                 continue
             
+            all_rates.update(rates)
+            successful_sources.append(source_name)
+            self.last_source_rates[source_name] = rates
+            
+            # Даже неизменившийся ответ (кеш или 304) сверяется с опубликованным снимком:
+            # прошлый цикл мог получить курсы, но не успеть их опубликовать
+            moved = self._changed_pairs(rates, published)
+            if not moved:
+                not_modified = ' (not modified)' if self.clients[source_name].data_unchanged else ''
+                self.logger.info(f'Rates from {source_name} already published{not_modified}')
+                continue
+            
+            history_records.extend(self._build_history_records(source_name, moved))
+            changed_rates.update(moved)
+            changed_sources.update(dict.fromkeys(moved, source_name))
+            self.logger.info(f'Successfully fetched {len(rates)} rates from {source_name}, changed: {len(moved)}')
+        
+        if late_sources:
+            self.logger.warning(
+                f'Update deadline {self.config.UPDATE_DEADLINE_SECONDS}s exceeded, skipping: {", ".join(late_sources)}'
+            )
+        
+        if history_records:
+            # Вся история цикла обновления - одной записью файла
             try:
-                self.logger.info(f'Fetching rates from {source_name}...')
-                rates = self.clients[source_name].fetch_rates()
-                
-                if not rates:
-                    self.logger.warning(f'No rates returned from {source_name}')
-                    continue
-                
-                for pair_key, rate in rates.items():
-                    try:
-                        if '_' in pair_key:
-                            from_currency, to_currency = pair_key.split('_')
-                        else:
-                            self.logger.warning(f'Invalid pair format: {pair_key}')
-                            continue
-                        
-                        rate_record = {
-                            'from_currency': from_currency,
-                            'to_currency': to_currency,
-                            'rate': rate,
-                            'source': source_name,
-                            'meta': {
-                                'request_timestamp': datetime.now().isoformat()
-                            }
-                        }
-                        self.storage.save_exchange_rate(rate_record)
-                    except Exception as e:
-                        self.logger.error(f'Error processing {pair_key}: {e}')
-                
-                all_rates.update(rates)
-                successful_sources.append(source_name)
-                self.logger.info(f'Successfully fetched {len(rates)} rates from {source_name}')
-                
-            except ApiRequestError as e:
-                self.logger.error(f'API error from {source_name}: {e}')
+                self.storage.save_exchange_rates_batch(history_records)
             except Exception as e:
-                self.logger.error(f'Unexpected error from {source_name}: {e}')
+                self.logger.error(f'Error saving rates history: {e}')
         
         if all_rates:
-            self.storage.save_current_rates(all_rates, ','.join(successful_sources))
-            self.logger.info(f'Update completed. Total rates: {len(all_rates)}')
+            # Свечи учитывают каждый опрос, в том числе курсы без изменения выше порога публикации
+            try:
+                self.candles.update(all_rates, time.time())
+            except Exception as e:
+                self.logger.error(f'Error updating candles: {e}')
+        
+        if all_rates and not changed_rates:
+            # На диск ничего не пишется, но успешный опрос продлевает свежесть опубликованного снимка
+            rate_snapshots.publish(published_snapshot.with_meta(
+                timestamp=datetime.now().isoformat(),
+                source=', '.join(successful_sources)
+            ))
+            self.logger.info(f'Update completed, no changes. Total rates: {len(all_rates)}')
+        elif all_rates:
+            self.logger.info(f'Update completed. Total rates: {len(all_rates)}, changed: {len(changed_rates)}')
             
-            self._save_to_files(all_rates, successful_sources)
+            self._save_to_files(published_snapshot, changed_rates, changed_sources, successful_sources)
         else:
             self.logger.warning('No rates were updated')
         
         return all_rates
     
-    def _save_to_files(self, rates: Dict[str, float], sources: list):
+    def _changed_pairs(self, rates: Dict[str, float], published: Dict[str, float]) -> Dict[str, float]:
+        '''
+        Пары, курс которых отличается от опубликованного больше чем на эпсилон своего класса активов
+        '''
+        changed = {}
+        for pair_key, rate in rates.items():
+            previous = published.get(pair_key)
+            if rate is None:
+                continue
+            if previous is None or previous == 0 or abs(rate - previous) / abs(previous) > self._epsilon(pair_key):
+                changed[pair_key] = rate
+        return changed
+    
+    def _epsilon(self, pair_key: str) -> float:
+        '''
+        Порог относительного изменения для класса активов пары (crypto / fiat)
+        '''
+        asset_class = 'crypto' if pair_key.split('_')[0] in self.config.CRYPTO_ID_MAP else 'fiat'
+        return self.config.PUBLISH_EPSILON.get(asset_class, 0.0)
+    
+    def _build_history_records(self, source_name: str, rates: Dict[str, float]) -> List[Dict[str, Any]]:
+        '''
+        Записи истории по одной на пару для курсов, полученных от источника
+        '''
+        records = []
+        for pair_key, rate in rates.items():
+            try:
+                if '_' in pair_key:
+                    from_currency, to_currency = pair_key.split('_')
+                else:
+                    self.logger.warning(f'Invalid pair format: {pair_key}')
+                    continue
+                
+                rate_record = {
+                    'from_currency': from_currency,
+                    'to_currency': to_currency,
+                    'rate': rate,
+                    'source': source_name,
+                    'meta': {
+                        'request_timestamp': datetime.now().isoformat()
+                    }
+                }
+                records.append(rate_record)
+            except Exception as e:
+                self.logger.error(f'Error processing {pair_key}: {e}')
+        return records
+    
+    def _save_to_files(self, published: RateSnapshot, changed: Dict[str, float],
+                       changed_sources: Dict[str, str], sources: list):
         '''
         Сохранение курсов в JSON файлы.
-        Передаём rates (список полученных валют) в виде словаря а source (источники) в виде списка
+        Передаём published (последний опубликованный снимок), changed (изменившиеся курсы)
+        и changed_sources (источник каждой изменившейся пары) в виде словарей,
+        а source (источники) в виде списка. В историю пишется только изменение
         '''
         try:
-            import json
-            from datetime import datetime
-            
-            data_to_save = {
-                'timestamp': datetime.now().isoformat(),
-                'source': ', '.join(sources),
-                'base_currency': self.config.BASE_CURRENCY,
-                'rates': rates,
-                'total_pairs': len(rates)
-            }
+            timestamp = datetime.now().isoformat()
+            source = ', '.join(sources)
             
-            with open(self.config.RATES_FILE_PATH, 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, indent=2, ensure_ascii=False)
+            # Публикуются только изменившиеся пары, остальные остаются из предыдущего снимка
+            rate_snapshots.save(published.updated(changed, changed_sources, timestamp, source))
             print(f'Данные сохранены в {self.config.RATES_FILE_PATH}')
             
-            with open(self.config.HISTORY_FILE_PATH, 'r', encoding='utf-8') as f:
-                try:
-                    existing_data = json.load(f)
-                except (json.JSONDecodeError, FileNotFoundError):
-                    existing_data = []
-            
-            if isinstance(existing_data, list):
-                existing_data.append(data_to_save)
-            else:
-                existing_data = [existing_data, data_to_save]
-            
-            with open(self.config.HISTORY_FILE_PATH, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, indent=2, ensure_ascii=False)
-            print(f'Данные добавлены в {self.config.HISTORY_FILE_PATH}')
+            self.history.append({
+                'timestamp': timestamp,
+                'source': source,
+                'base_currency': self.config.BASE_CURRENCY,
+                'rates': changed,
+                'total_pairs': len(changed),
+                'delta': True
+            })
+            print(f'Данные добавлены в {self.config.HISTORY_DIR}')
             
         except Exception as e:
             self.logger.error(f'Error saving to files: {e}')
     
+    def rate_limit_delay(self, sources: Optional[List[str]] = None) -> float:
+        '''
+        Секунд до момента, когда источники можно опросить без превышения лимитов
+        '''
+        names = sources or list(self.clients.keys())
+        return max((self.clients[name].rate_limit_wait() for name in names if name in self.clients), default=0.0)
+    
+    def get_sources_status(self) -> Dict[str, Dict[str, Any]]:
+        '''
+        Состояние автоматов отключения источников
+        '''
+        return {name: client.breaker.snapshot() for name, client in self.clients.items()}
+    
     def get_update_status(self) -> Dict[str, Any]:
         '''
         Получение статуса последнего обновления
         '''
         try:
-            import json
-            import os
-            
-            if os.path.exists(self.config.RATES_FILE_PATH):
-                with open(self.config.RATES_FILE_PATH, 'r', encoding='utf-8') as f:
-                    rates_data = json.load(f)
-                
-                return {
-                    'last_refresh': rates_data.get('timestamp'),
-                    'total_pairs': rates_data.get('total_pairs', 0),
-                    'source': rates_data.get('source', 'unknown')
-                }
-            else:
-                return {
-                    'last_refresh': None,
-                    'total_pairs': 0,
-                    'source': 'unknown'
-                }
+            snapshot = rate_snapshots.current()
+            return {
+                'last_refresh': snapshot.timestamp,
+                'total_pairs': len(snapshot.rates),
+                'source': snapshot.source
+            }
                 
         except Exception as e:
             self.logger.error(f'Error getting status: {e}')
@@ -0,0 +1,49 @@
+# valutatrade_hub/parser_service/volatility.py
+from collections import deque
+from typing import Dict, Optional
+
+
+# Адаптивный интервал опроса источника по волатильности курсов
+class VolatilityTracker:
+    '''
+    Скользящая скорость изменения курсов источника: для каждого нового снимка
+    берется наибольшее относительное изменение пары, деленное на время с прошлого снимка,
+    и усредняется по последним window снимкам.
+    Интервал подбирается так, чтобы за один опрос курс в среднем менялся на target_change,
+    и ограничивается [min_seconds, max_seconds]
+    '''
+    
+    def __init__(self, min_seconds: float, max_seconds: float, initial_seconds: float,
+                 target_change: float, window: int = 5):
+        self.min_seconds = min_seconds
+        self.max_seconds = max(min_seconds, max_seconds)
+        self.target_change = target_change
+        self._interval = self._clamp(initial_seconds)
+        self._speeds = deque(maxlen=max(1, window))
+        self._last_rates: Optional[Dict[str, float]] = None
+        self._last_time: Optional[float] = None
+    
+    def _clamp(self, seconds: float) -> float:
+        return min(self.max_seconds, max(self.min_seconds, seconds))
+    
+    def observe(self, rates: Dict[str, float], timestamp: float):
+        '''
+        Учет нового снимка курсов источника (timestamp - по монотонным часам)
+        '''
+        if self._last_rates is not None and timestamp > self._last_time:
+            change = 0.0
+            for pair, rate in rates.items():
+                previous = self._last_rates.get(pair)
+                if previous and rate is not None:
+                    change = max(change, abs(rate - previous) / abs(previous))
+            self._speeds.append(change / (timestamp - self._last_time))
+            
+            speed = sum(self._speeds) / len(self._speeds)
+            self._interval = self.max_seconds if speed <= 0 else self._clamp(self.target_change / speed)
+        
+        self._last_rates = dict(rates)
+        self._last_time = timestamp
+    
+    @property
+    def interval(self) -> float:
+        return self._interval